@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Archived modules import shared helpers (jit_utils, attendance_manager) from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
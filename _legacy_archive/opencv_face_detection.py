@@ -1,10 +1,60 @@
 import cv2
 import numpy as np
 import pickle
+import json
 import os
 from datetime import datetime
 import urllib.request
 
+from jit_utils import njit, NUMBA_AVAILABLE
+
+# Gallery: raw encodings, their unit-norm rows and the id/name index, loaded memory-mapped
+GALLERY_DIR = 'face_encodings'
+GALLERY_MATRIX_PATH = os.path.join(GALLERY_DIR, 'gallery.npy')
+GALLERY_NORMED_PATH = os.path.join(GALLERY_DIR, 'gallery_normed.npy')
+GALLERY_META_PATH = os.path.join(GALLERY_DIR, 'meta.json')
+
+
+@njit(fastmath=True, cache=True)
+def _grid_mean_std(face_img, out):
+    """Mean/std of each cell of a 4x4 grid in one pass per cell; returns values written"""
+    h, w = face_img.shape
+    count = 0
+    for i in range(4):
+        for j in range(4):
+            start_h = i * h // 4
+            end_h = (i + 1) * h // 4
+            start_w = j * w // 4
+            end_w = (j + 1) * w // 4
+            n = (end_h - start_h) * (end_w - start_w)
+            if n <= 0:
+                continue
+            total = 0.0
+            total_sq = 0.0
+            for y in range(start_h, end_h):
+                for x in range(start_w, end_w):
+                    p = float(face_img[y, x])
+                    total += p
+                    total_sq += p * p
+            mean = total / n
+            out[count] = mean
+            out[count + 1] = np.sqrt(max(total_sq / n - mean * mean, 0.0))
+            count += 2
+    return count
+
+
+def _normalize_rows(encodings):
+    matrix = np.array(encodings, dtype=np.float32, ndmin=2)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8
+    return matrix
+
+
+def _normalize_query(encoding):
+    query = np.array(encoding, dtype=np.float32)
+    query /= np.linalg.norm(query) + 1e-8
+    return query
+
+
 class OpenCVFaceSystem:
     def __init__(self):
         # Load OpenCV's face detectors
@@ -38,6 +88,8 @@ class OpenCVFaceSystem:
         
         self.known_faces = {}
         self.load_known_faces()
+        # Compile the grid kernel now so the first request doesn't pay for it
+        _grid_mean_std(np.zeros((100, 100), dtype=np.uint8), np.empty(32, dtype=np.float32))
         print("✅ OpenCV face detection system initialized")
     
     def face_locations(self, image, model="hog"):
@@ -67,14 +119,14 @@ class OpenCVFaceSystem:
         return locations
     
     def face_encodings(self, image, face_locations=None):
-        """Generate face features using OpenCV"""
-        if face_locations is None:
-            face_locations = self.face_locations(image)
-        
+        """Generate face features using OpenCV (accepts RGB or an already-gray image)"""
         if len(image.shape) == 3:
             gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
         else:
             gray = image
+        
+        if face_locations is None:
+            face_locations = self.face_locations(gray)  # reuse the gray frame, no second cvtColor
             
         encodings = []
         
@@ -94,34 +146,24 @@ class OpenCVFaceSystem:
     
     def extract_features(self, face_img):
         """Extract simple features from face image"""
-        features = []
+        features = np.empty(80, dtype=np.float32)  # 32 histogram + 32 grid + 16 edge bins
         
         # Method 1: Pixel intensity histogram
         hist = cv2.calcHist([face_img], [0], None, [32], [0, 256])
-        features.extend(hist.flatten())
+        features[:32] = hist.ravel()
         
         # Method 2: Local Binary Pattern
-        # Divide into 4x4 grid and compute LBP-like features
-        h, w = face_img.shape
-        for i in range(4):
-            for j in range(4):
-                start_h = i * h // 4
-                end_h = (i + 1) * h // 4
-                start_w = j * w // 4
-                end_w = (j + 1) * w // 4
-                
-                region = face_img[start_h:end_h, start_w:end_w]
-                if region.size > 0:
-                    # Calculate mean and std of region
-                    features.append(np.mean(region))
-                    features.append(np.std(region))
+        # Divide into 4x4 grid and compute LBP-like features (mean and std per cell)
+        grid_count = _grid_mean_std(np.ascontiguousarray(face_img), features[32:64])
         
         # Method 3: Edge features
         edges = cv2.Canny(face_img, 50, 150)
         edge_hist = cv2.calcHist([edges], [0], None, [16], [0, 256])
-        features.extend(edge_hist.flatten())
+        if grid_count < 32:  # tiny crops can leave empty grid cells
+            return np.concatenate([features[:32 + grid_count], edge_hist.ravel()])
+        features[64:] = edge_hist.ravel()
         
-        return np.array(features, dtype=np.float32)
+        return features
     
     def compare_faces(self, known_encodings, face_encoding, tolerance=0.6):
         """Compare faces using distance metrics"""
@@ -129,38 +171,54 @@ class OpenCVFaceSystem:
             return []
         
         distances = self.face_distance(known_encodings, face_encoding)
+        if distances.size == 0:
+            return []  # no distances to threshold; mean/std of an empty array would be nan
         
-        # Adaptive threshold based on data distribution
-        if len(distances) > 0:
-            mean_dist = np.mean(distances)
-            std_dist = np.std(distances)
-            threshold = mean_dist - (tolerance * std_dist)
-            threshold = max(threshold, mean_dist * 0.7)  # Don't go too low
-        else:
-            threshold = tolerance
-        
-        matches = [dist < threshold for dist in distances]
-        return matches
+        # Adaptive threshold based on data distribution (floored at 0.7 * mean so it
+        # doesn't go too low), then one vectorized comparison over all distances
+        mean_dist = distances.mean()
+        threshold = np.maximum(mean_dist - tolerance * distances.std(), mean_dist * 0.7)
+        return (distances < threshold).tolist()  # plain list of bools, like face_recognition
     
     def face_distance(self, face_encodings, face_to_compare):
         """Calculate distances between face encodings"""
         if len(face_encodings) == 0:
             return np.array([])
         
-        distances = []
-        for encoding in face_encodings:
-            # Normalize encodings for better comparison
-            norm1 = encoding / (np.linalg.norm(encoding) + 1e-8)
-            norm2 = face_to_compare / (np.linalg.norm(face_to_compare) + 1e-8)
-            
-            # Use cosine distance
-            dist = 1 - np.dot(norm1, norm2)
-            distances.append(dist)
+        # Normalize encodings for better comparison, then cosine distance in one matmul
+        return 1.0 - _normalize_rows(face_encodings) @ _normalize_query(face_to_compare)
+    
+    def known_face_distance(self, face_to_compare):
+        """Cosine distances to every known face, in get_known_encodings() order"""
+        if len(self._known_matrix_normed) == 0:
+            return np.array([])
+        return 1.0 - self._known_matrix_normed @ _normalize_query(face_to_compare)
+    
+    def face_distance_batch(self, face_encodings_batch):
+        """(F, N) cosine distances from every detected face to every known face in one matmul"""
+        if len(face_encodings_batch) == 0 or len(self._known_matrix_normed) == 0:
+            return np.empty((len(face_encodings_batch), len(self._known_matrix_normed)), dtype=np.float32)
+        return 1.0 - _normalize_rows(face_encodings_batch) @ self._known_matrix_normed.T
+    
+    def compare_faces_batch(self, face_encodings_batch, tolerance=0.6):
+        """compare_faces() for every detected face at once: returns ((F, N) matches, (F,) best index)"""
+        distances = self.face_distance_batch(face_encodings_batch)
+        if distances.size == 0:
+            return np.zeros(distances.shape, dtype=bool), np.full(len(distances), -1)
         
-        return np.array(distances)
+        # Same adaptive threshold as compare_faces, one row per detected face
+        mean_dist = distances.mean(axis=1, keepdims=True)
+        std_dist = distances.std(axis=1, keepdims=True)
+        threshold = np.maximum(mean_dist - tolerance * std_dist, mean_dist * 0.7)
+        return distances < threshold, np.argmin(distances, axis=1)
+    
+    def _rebuild_known_matrix(self):
+        """Stack the known encodings once as unit-norm float32 rows for matching"""
+        encodings = [face_data['encoding'] for face_data in self.known_faces.values()]
+        self._known_matrix_normed = _normalize_rows(encodings) if encodings else np.empty((0, 0), dtype=np.float32)
     
     def save_face_encoding(self, student_id, student_name, face_encoding):
-        """Save face encoding to file"""
+        """Save face encoding to the gallery"""
         face_data = {
             'student_id': student_id,
             'student_name': student_name,
@@ -168,27 +226,67 @@ class OpenCVFaceSystem:
             'timestamp': datetime.now().isoformat()
         }
         
-        filename = f"face_data_{student_id}.pkl"
-        filepath = os.path.join('face_encodings', filename)
-        
-        # Create directory if it doesn't exist
-        os.makedirs('face_encodings', exist_ok=True)
-        
-        with open(filepath, 'wb') as f:
-            pickle.dump(face_data, f)
-        
+        is_new = student_id not in self.known_faces
         self.known_faces[student_id] = face_data
+        if is_new and len(self._known_matrix_normed):
+            # Appended at the end of the dict, so only the new row needs normalizing
+            self._known_matrix_normed = np.vstack([self._known_matrix_normed, _normalize_rows([face_encoding])])
+        else:
+            self._rebuild_known_matrix()
+        self._save_gallery()
         print(f"💾 Saved face encoding for {student_name}")
     
+    def _save_gallery(self):
+        """Rewrite the gallery files (temp file + rename, so open memory maps stay valid)"""
+        os.makedirs(GALLERY_DIR, exist_ok=True)
+        ids = list(self.known_faces)
+        matrix = np.array([self.known_faces[i]['encoding'] for i in ids], dtype=np.float32, ndmin=2)
+        meta = [{'student_id': i,
+                 'student_name': self.known_faces[i]['student_name'],
+                 'timestamp': self.known_faces[i].get('timestamp')} for i in ids]
+        
+        for path, array in ((GALLERY_MATRIX_PATH, matrix), (GALLERY_NORMED_PATH, self._known_matrix_normed)):
+            with open(f"{path}.tmp", 'wb') as f:
+                np.save(f, array)
+            os.replace(f"{path}.tmp", path)
+        # Index last: a reader only trusts the matrices if their row count matches it
+        with open(f"{GALLERY_META_PATH}.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{GALLERY_META_PATH}.tmp", GALLERY_META_PATH)
+    
+    def _load_gallery(self):
+        """Map the saved gallery; returns False if it is missing or inconsistent"""
+        paths = (GALLERY_MATRIX_PATH, GALLERY_NORMED_PATH, GALLERY_META_PATH)
+        if not all(os.path.exists(path) for path in paths):
+            return False
+        with open(GALLERY_META_PATH) as f:
+            meta = json.load(f)
+        matrix = np.load(GALLERY_MATRIX_PATH, mmap_mode='r')
+        normed = np.load(GALLERY_NORMED_PATH, mmap_mode='r')
+        if len(matrix) != len(meta) or len(normed) != len(meta):
+            return False
+        
+        for entry, encoding in zip(meta, matrix):
+            self.known_faces[entry['student_id']] = dict(entry, encoding=encoding)
+        self._known_matrix_normed = normed
+        return True
+    
     def load_known_faces(self):
         """Load all known face encodings"""
-        if not os.path.exists('face_encodings'):
+        self._known_matrix_normed = np.empty((0, 0), dtype=np.float32)
+        if not os.path.exists(GALLERY_DIR):
+            return
+        
+        if self._load_gallery():
+            if self.known_faces:
+                print(f"📚 Loaded {len(self.known_faces)} known faces")
             return
         
+        # One-time migration from the old one-pickle-per-student layout
         loaded_count = 0
-        for filename in os.listdir('face_encodings'):
+        for filename in os.listdir(GALLERY_DIR):
             if filename.endswith('.pkl'):
-                filepath = os.path.join('face_encodings', filename)
+                filepath = os.path.join(GALLERY_DIR, filename)
                 try:
                     with open(filepath, 'rb') as f:
                         face_data = pickle.load(f)
@@ -198,8 +296,10 @@ class OpenCVFaceSystem:
                 except Exception as e:
                     print(f"⚠️  Could not load {filename}: {e}")
         
+        self._rebuild_known_matrix()
         if loaded_count > 0:
-            print(f"📚 Loaded {loaded_count} known faces")
+            self._save_gallery()
+            print(f"📚 Loaded {loaded_count} known faces (migrated to {GALLERY_MATRIX_PATH})")
     
     def get_known_encodings(self):
         """Get all known face encodings as arrays"""
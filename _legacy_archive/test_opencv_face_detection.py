@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+from opencv_face_detection import opencv_face_system
+
+
+def test_compare_faces_empty_known_encodings():
+    face = np.random.rand(32).astype(np.float32)
+    assert opencv_face_system.compare_faces([], face) == []
+    assert opencv_face_system.compare_faces(np.empty((0, 32), dtype=np.float32), face) == []
+
+
+def test_compare_faces_matches_closest():
+    known = np.eye(4, dtype=np.float32)
+    matches = opencv_face_system.compare_faces(known, known[2])
+    assert matches == [False, False, True, False]
@@ -1,6 +1,6 @@
-import sqlite3
 from datetime import datetime, timedelta
-import pytz
+from attendance_manager import IST
+from db_utils import connect as db_connect
 
 class AnalyticsManager:
     def __init__(self, db_path='attendance.db'):
@@ -8,10 +8,9 @@ class AnalyticsManager:
 
     def get_class_analytics(self, days=14):
         """Fetches comprehensive class analytics for the last N days"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connect(self.db_path)
         cursor = conn.cursor()
-        timezone = pytz.timezone('Asia/Kolkata')
-        end_date = datetime.now(timezone).date()
+        end_date = datetime.now(IST).date()
         start_date = end_date - timedelta(days=days)
 
         # 1. Total Active Students
@@ -91,10 +90,9 @@ class AnalyticsManager:
 
     def get_heatmap_data(self, days=90):
         """Returns per-day attendance percentage for the last N days (for calendar heatmap)."""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connect(self.db_path)
         cursor = conn.cursor()
-        timezone = pytz.timezone('Asia/Kolkata')
-        end_date = datetime.now(timezone).date()
+        end_date = datetime.now(IST).date()
         start_date = end_date - timedelta(days=days)
 
         cursor.execute("SELECT COUNT(*) FROM students WHERE status = 'active'")
@@ -119,10 +117,9 @@ class AnalyticsManager:
 
     def get_day_of_week_stats(self, days=60):
         """Returns average attendance % per weekday (Mon=0 … Sat=5) over last N days."""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connect(self.db_path)
         cursor = conn.cursor()
-        timezone = pytz.timezone('Asia/Kolkata')
-        end_date = datetime.now(timezone).date()
+        end_date = datetime.now(IST).date()
         start_date = end_date - timedelta(days=days)
 
         cursor.execute("SELECT COUNT(*) FROM students WHERE status = 'active'")
@@ -154,10 +151,9 @@ class AnalyticsManager:
 
     def get_at_risk_students(self, threshold=75):
         """Returns all students below attendance threshold with pct and consecutive absence streak."""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connect(self.db_path)
         cursor = conn.cursor()
-        timezone = pytz.timezone('Asia/Kolkata')
-        today = datetime.now(timezone).date()
+        today = datetime.now(IST).date()
         start_date = today - timedelta(days=30)
 
         cursor.execute("SELECT id, name, student_id, joining_date FROM students WHERE status = 'active'")
@@ -213,10 +209,9 @@ class AnalyticsManager:
 
     def get_student_sparkline(self, student_id, days=14):
         """Returns per-day slot count for a student over last N days (for sparkline chart)."""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connect(self.db_path)
         cursor = conn.cursor()
-        timezone = pytz.timezone('Asia/Kolkata')
-        today = datetime.now(timezone).date()
+        today = datetime.now(IST).date()
         start_date = today - timedelta(days=days)
 
         sparkline = []
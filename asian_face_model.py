@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 try:
     import insightface
+    from insightface.utils import face_align
     INSIGHTFACE_AVAILABLE = True
     print("[OK] InsightFace available")
 except ImportError:
@@ -17,10 +18,17 @@ class AsianFaceRecognizer:
         
         if INSIGHTFACE_AVAILABLE:
             try:
+                import onnxruntime
                 from insightface.app import FaceAnalysis
-                # Initialize buffalo_l specifically
-                self.insight_app = FaceAnalysis(name='buffalo_l')
+                # Initialize buffalo_l specifically; only detection + recognition are used,
+                # so the landmark and gender/age models are never loaded or run
+                providers = [p for p in ('CUDAExecutionProvider', 'CPUExecutionProvider')
+                             if p in onnxruntime.get_available_providers()]
+                self.insight_app = FaceAnalysis(name='buffalo_l', allowed_modules=['detection', 'recognition'],
+                                                providers=providers)
                 self.insight_app.prepare(ctx_id=0, det_size=(640, 640))
+                self.rec_model = self.insight_app.models['recognition']
+                print(f"[OK] buffalo_l running on {providers[0]}")
                 self.use_insightface = True
                 print(f"[MODEL] buffalo_l w600k model loaded - {self.embedding_dim}D embeddings")
                 
@@ -63,36 +71,39 @@ class AsianFaceRecognizer:
             
             print(f"[DEBUG] buffalo_l processing frame: {frame.shape}")
             
-            # Get faces with buffalo_l w600k
-            results = self.insight_app.get(bgr_frame)
+            # Detect once, then embed every aligned face crop in a single batched forward
+            # pass instead of one recognition run per face
+            bboxes, kpss = self.insight_app.det_model.detect(bgr_frame, max_num=0, metric='default')
+            if len(bboxes) == 0 or kpss is None:
+                embeddings = []
+            else:
+                crops = [face_align.norm_crop(bgr_frame, landmark=kps, image_size=self.rec_model.input_size[0])
+                         for kps in kpss]
+                embeddings = self.rec_model.get_feat(crops)
             
-            for i, face in enumerate(results):
-                bbox = face.bbox.astype(int)
-                # Convert to (top, right, bottom, left) format
-                top, right, bottom, left = bbox[1], bbox[2], bbox[3], bbox[0]
+            for i, (bbox, embedding) in enumerate(zip(bboxes, embeddings)):
+                # Convert to (top, right, bottom, left) format; one .tolist() gives plain
+                # Python ints, so callers never need per-coordinate int() casts
+                left, top, right, bottom = bbox[:4].astype(int).tolist()
                 
                 # CRITICAL: Verify 512D embedding
-                if hasattr(face, 'embedding'):
-                    embedding = face.embedding
-                    print(f"[DEBUG] buffalo_l face {i+1}: embedding shape {embedding.shape}")
-                    
-                    if len(embedding) == self.embedding_dim:  # Must be 512D
-                        # Validate embedding quality
-                        if np.isfinite(embedding).all() and np.linalg.norm(embedding) > 0:
-                            faces.append({
-                                'location': (top, right, bottom, left),
-                                'confidence': float(face.det_score),
-                                'embedding': embedding.astype(np.float64),  # Ensure consistent dtype
-                                'source': f'buffalo_l_w600k_512D',
-                                'embedding_norm': float(np.linalg.norm(embedding))
-                            })
-                            print(f"[DEBUG] [OK] Valid 512D embedding: norm={np.linalg.norm(embedding):.3f}")
-                        else:
-                            print(f"[DEBUG] [ERROR] Invalid embedding values")
+                print(f"[DEBUG] buffalo_l face {i+1}: embedding shape {embedding.shape}")
+                
+                if len(embedding) == self.embedding_dim:  # Must be 512D
+                    # Validate embedding quality
+                    if np.isfinite(embedding).all() and np.linalg.norm(embedding) > 0:
+                        faces.append({
+                            'location': (top, right, bottom, left),
+                            'confidence': float(bbox[4]),
+                            'embedding': embedding.astype(np.float32, copy=False),  # float32 end to end, as stored by registration
+                            'source': f'buffalo_l_w600k_512D',
+                            'embedding_norm': float(np.linalg.norm(embedding))
+                        })
+                        print(f"[DEBUG] [OK] Valid 512D embedding: norm={np.linalg.norm(embedding):.3f}")
                     else:
-                        print(f"[DEBUG] [ERROR] Wrong embedding dimension: {len(embedding)} (expected {self.embedding_dim})")
+                        print(f"[DEBUG] [ERROR] Invalid embedding values")
                 else:
-                    print(f"[DEBUG] [ERROR] No embedding found for face")
+                    print(f"[DEBUG] [ERROR] Wrong embedding dimension: {len(embedding)} (expected {self.embedding_dim})")
                     
         except Exception as e:
             print(f"[ERROR] buffalo_l detection error: {e}")
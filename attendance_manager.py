@@ -6,11 +6,11 @@ Now reads slot timings from session_configs database table for admin configurabi
 Fixed with proper IST timezone handling
 """
 
-import sqlite3
 from datetime import datetime, time
 from typing import Dict, List, Tuple, Optional
 import logging
 import pytz
+from db_utils import connect as db_connect
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -40,7 +40,7 @@ class AttendanceSlotManager:
     
     def __init__(self, db_path: str = 'attendance.db'):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn = db_connect(db_path, check_same_thread=False)
         self.init_slot_tables()
         
         # Load attendance slots from database instead of hardcoded values
@@ -76,6 +76,9 @@ class AttendanceSlotManager:
                 UNIQUE(student_id, date, slot_id)
             )
         ''')
+        # Per-day/per-slot counts (dashboard, exports); the UNIQUE constraint already
+        # indexes (student_id, date, slot_id) for per-student lookups
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_slot_date_slot ON slot_attendance(date, slot_id, student_id)')
         
         # Create daily_attendance_summary for quick counts
         cursor.execute('''
@@ -455,33 +458,7 @@ class AttendanceSlotManager:
             date_str = get_ist_date_str()
         
         try:
-            cursor = self.conn.cursor()
-            
-            # Get total active students
-            cursor.execute('SELECT COUNT(*) FROM students WHERE status = "active"')
-            total_students = cursor.fetchone()[0]
-            
-            # Get counts by slot
-            cursor.execute('''
-                SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                WHERE date = ? AND slot_id LIKE 'morning%'
-            ''', (date_str,))
-            morning_count = cursor.fetchone()[0]
-            
-            cursor.execute('''
-                SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                WHERE date = ? AND slot_id LIKE 'afternoon%'
-            ''', (date_str,))
-            afternoon_count = cursor.fetchone()[0]
-            
-            # Get unique students present (attended at least one slot)
-            cursor.execute('''
-                SELECT COUNT(DISTINCT student_id)
-                FROM slot_attendance 
-                WHERE date = ?
-            ''', (date_str,))
-            
-            total_present = cursor.fetchone()[0]
+            total_students, morning_count, afternoon_count, total_present = self._day_counts(date_str)
             absent_count = total_students - total_present
             
             # Get current slot info
@@ -515,32 +492,32 @@ class AttendanceSlotManager:
                 'total_absent': 0
             }
     
+    def _day_counts(self, date_str: str):
+        """(active students, morning present, afternoon present, total present) for one day in a single query"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM students WHERE status = "active"),
+                   COALESCE(SUM(morn), 0),
+                   COALESCE(SUM(aft), 0),
+                   COUNT(*)
+            FROM (
+                SELECT student_id,
+                       MAX(slot_id LIKE 'morning%') AS morn,
+                       MAX(slot_id LIKE 'afternoon%') AS aft
+                FROM slot_attendance
+                WHERE date = ?
+                GROUP BY student_id
+            )
+        ''', (date_str,))
+        return cursor.fetchone()
+    
     def update_daily_summary(self, date_str: str):
         """Update the daily attendance summary table"""
         try:
             cursor = self.conn.cursor()
             
             # Get counts
-            cursor.execute('SELECT COUNT(*) FROM students WHERE status = "active"')
-            total_students = cursor.fetchone()[0]
-            
-            cursor.execute('''
-                SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                WHERE date = ? AND slot_id LIKE "morning%"
-            ''', (date_str,))
-            morning_count = cursor.fetchone()[0]
-            
-            cursor.execute('''
-                SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                WHERE date = ? AND slot_id LIKE "afternoon%" 
-            ''', (date_str,))
-            afternoon_count = cursor.fetchone()[0]
-            
-            cursor.execute('''
-                SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                WHERE date = ?
-            ''', (date_str,))
-            total_present = cursor.fetchone()[0]
+            total_students, morning_count, afternoon_count, total_present = self._day_counts(date_str)
             
             # Update summary with IST timestamp
             cursor.execute('''
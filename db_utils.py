@@ -0,0 +1,63 @@
+"""
+SQLite connection helpers shared by the attendance modules.
+
+Every connection to attendance.db gets the same PRAGMAs: WAL so the web app, slot
+manager and analytics readers don't block each other, synchronous=NORMAL (safe with
+WAL, far fewer fsyncs per commit), in-memory temp tables, a 256 MB mmap window and
+a 64 MB page cache. Connections also keep a larger per-connection statement cache so
+the constant query strings used by the endpoints stay prepared.
+ConnectionPool hands out extra connections to endpoints that run in FastAPI's
+threadpool, so long read-only queries don't queue behind the shared connection.
+"""
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+DB_PATH = 'attendance.db'
+STATEMENT_CACHE_SIZE = 256  # sqlite3 default is 128 prepared statements per connection
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",  # 64 MB page cache (negative = KiB)
+)
+
+
+def apply_pragmas(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Apply the standard PRAGMAs to an open connection"""
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def connect(db_path: str = DB_PATH, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect() with the standard PRAGMAs applied"""
+    kwargs.setdefault('cached_statements', STATEMENT_CACHE_SIZE)
+    return apply_pragmas(sqlite3.connect(db_path, **kwargs))
+
+
+class ConnectionPool:
+    """Fixed-size pool of connections (opened lazily) for read-heavy endpoints"""
+
+    def __init__(self, db_path: str = DB_PATH, size: int = None):
+        self.db_path = db_path
+        self.size = size or min(8, os.cpu_count() or 1)
+        self._pool = queue.LifoQueue()
+        for _ in range(self.size):
+            self._pool.put(None)  # placeholder, replaced by a real connection on first use
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the with-block (blocks while all are in use)"""
+        conn = self._pool.get()
+        try:
+            if conn is None:
+                conn = connect(self.db_path, check_same_thread=False)
+            yield conn
+        finally:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
@@ -0,0 +1,238 @@
+"""
+Shared face gallery for recognition endpoints.
+
+Registered embeddings are kept as one L2-normalized float32 (N, D) matrix stored
+in `known_faces.f32`, with the matching student ids/names in `known_faces.ids.json`.
+Every uvicorn worker maps the same file read-only, so the gallery lives once in the
+OS page cache instead of once per process. Writers replace both files atomically
+(temp file + rename) under an exclusive lock so readers never see a torn matrix.
+"""
+import os
+import json
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows - rename is still atomic, just no advisory lock
+    fcntl = None
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+    print("[OK] SimSIMD available - SIMD cosine matching enabled")
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+    print("[WARN] SimSIMD not available - using NumPy cosine matching")
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+    print("[OK] FAISS available - HNSW index for large face galleries")
+except ImportError:
+    FAISS_AVAILABLE = False
+    print("[WARN] FAISS not available - large galleries use exhaustive search")
+
+FACE_MATRIX_PATH = 'known_faces.f32'
+FACE_INDEX_PATH = 'known_faces.ids.json'
+FACE_LOCK_PATH = 'known_faces.lock'
+ANN_MIN_GALLERY = 256  # below this an exhaustive gemm beats an HNSW walk
+HNSW_M = 32  # graph neighbours per node
+HNSW_EF_SEARCH = 64  # candidate list size per query (recall vs speed)
+STORED_EMBEDDING_DIMS = (512, 128)  # buffalo_l, legacy face_recognition
+
+
+class _FaceStoreLock:
+    """Advisory file lock around gallery writes/reads (no-op without fcntl)"""
+
+    def __init__(self, exclusive: bool):
+        self.exclusive = exclusive
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.handle = open(FACE_LOCK_PATH, 'a')
+            fcntl.flock(self.handle, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        return False
+
+
+def _write_unlocked(matrix: np.ndarray, ids: list, names: list):
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    header = {
+        'count': int(matrix.shape[0]),
+        'dim': int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        'ids': [int(i) for i in ids],
+        'names': list(names)
+    }
+
+    tmp_matrix = f"{FACE_MATRIX_PATH}.tmp"
+    tmp_index = f"{FACE_INDEX_PATH}.tmp"
+    with open(tmp_matrix, 'wb') as f:
+        f.write(matrix.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    with open(tmp_index, 'w') as f:
+        json.dump(header, f)
+        f.flush()
+        os.fsync(f.fileno())
+    # Index first so a reader that sees the new matrix mtime also sees its ids
+    os.replace(tmp_index, FACE_INDEX_PATH)
+    os.replace(tmp_matrix, FACE_MATRIX_PATH)
+
+
+def _open_unlocked():
+    mtime = face_matrix_mtime()
+    if mtime is None or not os.path.exists(FACE_INDEX_PATH):
+        return None
+    with open(FACE_INDEX_PATH) as f:
+        header = json.load(f)
+
+    count, dim = header['count'], header['dim']
+    if count == 0 or dim == 0:
+        matrix = np.empty((0, dim or 512), dtype=np.float32)
+    elif os.path.getsize(FACE_MATRIX_PATH) != count * dim * 4:
+        return None  # size doesn't match the index, rebuild from the database
+    else:
+        matrix = np.memmap(FACE_MATRIX_PATH, dtype=np.float32, mode='r', shape=(count, dim))
+    return matrix, header['ids'], header['names'], mtime
+
+
+def write_face_matrix(matrix: np.ndarray, ids: list, names: list):
+    """Atomically publish the gallery matrix and its id/name index"""
+    with _FaceStoreLock(exclusive=True):
+        _write_unlocked(matrix, ids, names)
+
+
+def update_face_matrix(transform):
+    """Read-modify-write the published gallery under one exclusive lock.
+
+    transform(matrix, ids, names) -> (matrix, ids, names). Returns False if there is no
+    published gallery to update (caller should rebuild from the database).
+    """
+    with _FaceStoreLock(exclusive=True):
+        current = _open_unlocked()
+        if current is None:
+            return False
+        matrix, ids, names, _ = current
+        _write_unlocked(*transform(np.array(matrix), list(ids), list(names)))
+        return True
+
+
+def face_matrix_mtime():
+    """Modification time of the published matrix, or None if it doesn't exist"""
+    try:
+        return os.stat(FACE_MATRIX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def open_face_matrix():
+    """Map the published gallery read-only: returns (matrix, ids, names, mtime) or None"""
+    with _FaceStoreLock(exclusive=False):
+        return _open_unlocked()
+
+
+def encode_embedding(embedding) -> bytes:
+    """Embedding as a database BLOB: raw little-endian float32"""
+    return np.asarray(embedding, dtype='<f4').tobytes()
+
+
+def decode_embedding(blob) -> np.ndarray:
+    """Database BLOB back to a float32 vector (zero-copy for float32 rows)
+    
+    Rows written before the switch to float32 hold float64; for the stored dimensions
+    (512, 128) the two layouts never have the same byte length.
+    """
+    if len(blob) in [dim * 4 for dim in STORED_EMBEDDING_DIMS]:
+        return np.frombuffer(blob, dtype='<f4')
+    return np.frombuffer(blob, dtype=np.float64).astype(np.float32)
+
+
+def quantize_int8(matrix: np.ndarray) -> np.ndarray:
+    """Quantize rows to int8 with a symmetric per-row scale for the SIMD int8 cosine path.
+
+    Each row is scaled so its largest component maps to +/-127. Cosine ignores the
+    per-row scale, so it isn't kept; a fixed x127 scale would leave 512-D unit vectors
+    (components around 0.05) with only a handful of int8 levels.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    peak = np.max(np.abs(matrix), axis=-1, keepdims=True)
+    scale = np.divide(127.0, peak, out=np.zeros_like(peak), where=peak > 0)
+    return np.ascontiguousarray(np.clip(np.rint(matrix * scale), -127, 127), dtype=np.int8)
+
+
+def build_ann_index(matrix: np.ndarray):
+    """HNSW inner-product index over the gallery, or None if FAISS is missing or the gallery is small
+    
+    Rows are unit-norm, so the inner product is the cosine similarity and the recognition
+    threshold applies to it directly.
+    """
+    if not FAISS_AVAILABLE or matrix is None or len(matrix) < ANN_MIN_GALLERY:
+        return None
+    index = faiss.IndexHNSWFlat(matrix.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+    return index
+
+
+def best_match(matrix: np.ndarray, embedding, matrix_i8: np.ndarray = None):
+    """Cosine-match one embedding against the gallery: returns (index, similarity) or None
+
+    A one-face batch through best_matches(), so both take the same backend.
+    """
+    if matrix is None or len(matrix) == 0:
+        return None
+    return best_matches(matrix, [embedding], matrix_i8)[0]
+
+
+def best_matches(matrix: np.ndarray, embeddings, matrix_i8: np.ndarray = None, threshold: float = None,
+                 ann_index=None) -> list:
+    """Cosine-match a batch of embeddings in one call: returns [(index, similarity) or None, ...]
+
+    Entries are None for zero-length queries and, if a threshold is given, for faces
+    whose best similarity doesn't exceed it. An ann_index from build_ann_index() replaces
+    the exhaustive scan with an approximate top-1 search. Otherwise SimSIMD (the default
+    backend, pinned in requirements.txt) scores the batch, and a NumPy gemm covers
+    installs without it.
+    """
+    if len(embeddings) == 0:
+        return []
+    if matrix is None or len(matrix) == 0:
+        return [None] * len(embeddings)
+    queries = np.array(embeddings, dtype=np.float32, ndmin=2)
+    if queries.shape[1] != matrix.shape[1]:
+        return [None] * len(embeddings)
+    norms = np.linalg.norm(queries, axis=1)
+    queries /= np.where(norms == 0, 1.0, norms)[:, None]
+    
+    if ann_index is not None and ann_index.ntotal == len(matrix):
+        # O(log N) graph search per face instead of scoring every gallery row
+        similarities, indices = ann_index.search(queries, 1)
+        similarities, indices = similarities[:, 0], indices[:, 0]
+    elif SIMSIMD_AVAILABLE:
+        # One (Q, N) SIMD cosine-distance call for every detected face at once
+        if matrix_i8 is not None and len(matrix_i8) == len(matrix):
+            distances = np.asarray(simsimd.cdist(quantize_int8(queries), matrix_i8, metric="cosine"))
+            indices = np.argmin(distances, axis=1)
+            # Re-score the int8 winners exactly so thresholds see float32 similarities
+            similarities = np.einsum('ij,ij->i', np.asarray(matrix)[indices], queries)
+        else:
+            distances = np.asarray(simsimd.cdist(queries, matrix, metric="cosine"))
+            indices = np.argmin(distances, axis=1)
+            similarities = 1.0 - distances[np.arange(len(queries)), indices]
+    else:
+        scores = queries @ matrix.T  # single BLAS gemm for the whole batch
+        indices = np.argmax(scores, axis=1)
+        similarities = scores[np.arange(len(queries)), indices]
+    
+    accepted = (norms != 0) & (indices >= 0)  # the HNSW search reports -1 if it finds nothing
+    if threshold is not None:
+        accepted &= similarities > threshold  # one vectorized threshold test for the batch
+    return [(int(indices[i]), float(similarities[i])) if accepted[i] else None
+            for i in range(len(queries))]
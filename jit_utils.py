@@ -0,0 +1,24 @@
+"""
+Optional Numba JIT helpers.
+
+When numba is installed `njit`/`prange` are the real thing; otherwise they fall back
+to no-op stand-ins so decorated kernels still run as plain Python/NumPy.
+"""
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+    print("[OK] Numba available - JIT kernels enabled")
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("[WARN] Numba not available - JIT kernels run as plain Python")
+
+    def njit(*args, **kwargs):
+        """No-op replacement for numba.njit (supports bare and parameterized use)"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
+
+    prange = range
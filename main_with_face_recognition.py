@@ -14,31 +14,37 @@ import json
 import uuid
 from datetime import datetime, timedelta
 from datetime import time
+from time import monotonic
 from typing import Optional, List
 from enum import Enum
 import numpy as np
 from PIL import Image
 import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from camera_manager import camera_manager
 from asian_face_model import asian_face_recognizer
 import secrets
 import hashlib
 from phase1_integration import enhance_existing_attendance_system, add_phase1_api_endpoints
-from attendance_manager import create_slot_manager_instance
-import pytz
+from attendance_manager import create_slot_manager_instance, IST
 import csv
+from collections import defaultdict
 from io import StringIO
+from itertools import groupby, islice
+from operator import itemgetter
 from analytics_manager import AnalyticsManager
 from anti_spoofing import anti_spoof_checker
+from jit_utils import njit
+from db_utils import connect as db_connect, ConnectionPool
+from face_matcher import (write_face_matrix, update_face_matrix, open_face_matrix, face_matrix_mtime,
+                          best_match, best_matches, quantize_int8, build_ann_index, SIMSIMD_AVAILABLE,
+                          encode_embedding, decode_embedding)
 
-# Initialize managers
+# Initialize managers (process-wide; endpoints reuse these instead of constructing their own)
 attendance_manager = create_slot_manager_instance()
 analytics_manager = AnalyticsManager()
 
-# Convert to a specific timezone (e.g., Asia/Kolkata)
-timezone = pytz.timezone('Asia/Kolkata')
-localized_time = timezone.localize(datetime(2025, 8, 1))
-
 
 # Add system path for OpenCV
 sys.path.insert(0, '/usr/lib/python3/dist-packages')
@@ -117,11 +123,15 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 SESSION_SECRET_KEY = secrets.token_urlsafe(32)
 ACTIVE_SESSIONS: Dict[str, Dict[str, Any]] = {}
 SESSION_TIMEOUT_HOURS = 24
+SESSION_CLEANUP_INTERVAL = 300  # seconds between full sweeps of ACTIVE_SESSIONS
 
 class SessionManager:
+    _next_cleanup_at = 0.0
+    
     @staticmethod
     def create_session(user_type: str, user_info: dict) -> str:
         """Create a new session and return session token"""
+        SessionManager.maybe_cleanup_expired_sessions()
         session_token = secrets.token_urlsafe(32)
         expires_at = datetime.now() + timedelta(hours=SESSION_TIMEOUT_HOURS)
         
@@ -130,6 +140,7 @@ class SessionManager:
             "user_info": user_info,
             "created_at": datetime.now(),
             "expires_at": expires_at,
+            "expires_at_ts": monotonic() + SESSION_TIMEOUT_HOURS * 3600,  # cheap expiry check
             "last_activity": datetime.now()
         }
         
@@ -139,14 +150,13 @@ class SessionManager:
     @staticmethod
     def validate_session(session_token: str) -> Optional[Dict[str, Any]]:
         """Validate session token and return session data if valid"""
-        if not session_token or session_token not in ACTIVE_SESSIONS:
+        session = ACTIVE_SESSIONS.get(session_token) if session_token else None
+        if session is None:
             return None
         
-        session = ACTIVE_SESSIONS[session_token]
-        
         # Check if session has expired
-        if datetime.now() > session["expires_at"]:
-            del ACTIVE_SESSIONS[session_token]
+        if monotonic() > session["expires_at_ts"]:
+            ACTIVE_SESSIONS.pop(session_token, None)
             return None
         
         # Update last activity
@@ -156,10 +166,10 @@ class SessionManager:
     @staticmethod
     def destroy_session(session_token: str) -> bool:
         """Destroy a session"""
-        if session_token in ACTIVE_SESSIONS:
-            user_info = ACTIVE_SESSIONS[session_token].get("user_info", {})
+        session = ACTIVE_SESSIONS.pop(session_token, None)
+        if session is not None:
+            user_info = session.get("user_info", {})
             print(f"🔓 Session destroyed for: {user_info.get('name', user_info.get('username', 'Unknown'))}")
-            del ACTIVE_SESSIONS[session_token]
             return True
         return False
     
@@ -168,17 +178,30 @@ class SessionManager:
         """Get count of active sessions"""
         return len(ACTIVE_SESSIONS)
     
+    @staticmethod
+    def maybe_cleanup_expired_sessions():
+        """Full expiry sweep, at most once per SESSION_CLEANUP_INTERVAL.
+
+        Reads already drop expired sessions lazily in validate_session; this only keeps
+        abandoned sessions from piling up, so it runs when new sessions are created.
+        """
+        now = monotonic()
+        if now < SessionManager._next_cleanup_at:
+            return
+        SessionManager._next_cleanup_at = now + SESSION_CLEANUP_INTERVAL
+        SessionManager.cleanup_expired_sessions()
+    
     @staticmethod
     def cleanup_expired_sessions():
         """Remove expired sessions"""
-        current_time = datetime.now()
+        current_time = monotonic()
         expired_tokens = [
-            token for token, session in ACTIVE_SESSIONS.items()
-            if current_time > session["expires_at"]
+            token for token, session in list(ACTIVE_SESSIONS.items())
+            if current_time > session["expires_at_ts"]
         ]
         
         for token in expired_tokens:
-            del ACTIVE_SESSIONS[token]
+            ACTIVE_SESSIONS.pop(token, None)
         
         if expired_tokens:
             print(f"🧹 Cleaned up {len(expired_tokens)} expired sessions")
@@ -241,56 +264,286 @@ class RegistrationComplete(BaseModel):
 class DetectionImage(BaseModel):
     image_data: str
 
+# Parsed session_configs windows are cached for this many seconds; timing edits made
+# through the slot manager use their own connection, so keep the TTL short
+SESSION_CONFIG_CACHE_TTL = 60
+
+# Minimum cosine similarity for a face to count as a registered student
+RECOGNITION_THRESHOLD = 0.60
+
+# Dashboard stats are served from memory for this many seconds unless the data changed
+DASHBOARD_STATS_CACHE_TTL = 5
+
+# Today's slot marks per active student. One LEFT JOIN + GROUP BY: each student's rows
+# for the day are a single range scan on the UNIQUE(student_id, date, slot_id) index.
+# Kept as one constant string so every pooled connection reuses its cached statement.
+SLOT_TODAY_SQL = '''
+    SELECT s.name, s.student_id, s.email, 
+           MAX(CASE WHEN sa.slot_id = 'morning_1' THEN sa.created_at END) as morning_1_time,
+           MAX(CASE WHEN sa.slot_id = 'morning_2' THEN sa.created_at END) as morning_2_time,
+           MAX(CASE WHEN sa.slot_id = 'afternoon_1' THEN sa.created_at END) as afternoon_1_time,
+           MAX(CASE WHEN sa.slot_id = 'afternoon_2' THEN sa.created_at END) as afternoon_2_time,
+           s.id
+    FROM students s
+    LEFT JOIN slot_attendance sa ON s.id = sa.student_id AND sa.date = ?
+    WHERE s.status = 'active'
+    GROUP BY s.id
+    ORDER BY s.name
+'''
+
+# Manual slot mark; UNIQUE(student_id, date, slot_id) turns an existing mark into a no-op
+SLOT_MANUAL_INSERT_SQL = '''
+    INSERT OR IGNORE INTO slot_attendance 
+    (student_id, date, slot_id, time_marked, is_manual, manual_reason, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Background pool for photo writes so request handlers don't wait on disk
+_IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="photo-io")
+
+def _write_file(path: str, data: bytes):
+    """Write bytes to disk (runs on _IO_POOL)"""
+    try:
+        with open(path, 'wb') as f:
+            f.write(data)
+    except OSError as e:
+        print(f"[ERROR] Failed to save photo {path}: {e}")
+
+def decode_image_rgb(image_data: str) -> np.ndarray:
+    """Decode a base64 (optionally data-URL) camera frame into an RGB uint8 array"""
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    image_bytes = base64.b64decode(image_data)
+    
+    if OPENCV_AVAILABLE:
+        # Straight into a numpy array via libjpeg-turbo; EXIF orientation ignored like PIL
+        bgr = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8),
+                           cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if bgr is not None:
+            return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.asarray(image)  # read-only view of PIL's bytes: one copy instead of two
+
+
+def encode_jpeg(image_rgb: np.ndarray, quality: int = 90) -> bytes:
+    """JPEG-encode an RGB uint8 array (libjpeg-turbo via OpenCV, PIL as fallback)"""
+    if OPENCV_AVAILABLE:
+        ok, encoded = cv2.imencode('.jpg', cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR),
+                                   [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            return encoded.tobytes()
+    buf = io.BytesIO()
+    Image.fromarray(image_rgb).save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+CSV_STREAM_CHUNK_ROWS = 500
+
+
+def csv_stream(rows, chunk_rows: int = CSV_STREAM_CHUNK_ROWS):
+    """Encode CSV rows for StreamingResponse a chunk at a time, reusing one small buffer"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = iter(rows)
+    while True:
+        # writerows runs the per-row quoting/encoding loop in C for the whole chunk
+        writer.writerows(islice(rows, chunk_rows))
+        if not buffer.tell():
+            return
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+FACE_LOCATION_KEYS = ("top", "right", "bottom", "left")
+
+
+def face_location_dicts(detected_faces):
+    """(top, right, bottom, left) boxes as JSON-ready dicts (the detector already yields Python ints)"""
+    return [dict(zip(FACE_LOCATION_KEYS, face['location'])) for face in detected_faces]
+
+
+@njit(cache=True, fastmath=True)
+def _quality_score(img, top, right, bottom, left):
+    """Registration photo quality: face bbox area as % of the frame, capped at 10"""
+    image_area = img.shape[0] * img.shape[1]
+    if image_area == 0:
+        return 0.0
+    face_area = (bottom - top) * (right - left)
+    return min(face_area / image_area * 100.0, 10.0)
+
 class AttendanceSystem:
     def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.known_face_ids = []
+        self.known_face_matrix = None  # (N, 512) unit-norm float32, memory-mapped from known_faces.f32
+        self.known_face_matrix_i8 = None  # int8-quantized copy of known_face_matrix for SIMD matching
+        self.known_face_index = None  # HNSW index over known_face_matrix for large galleries (FAISS)
+        self.known_face_names = ()  # row-aligned with known_face_matrix
+        self.known_face_ids = np.empty(0, dtype=np.int64)  # row-aligned with known_face_matrix
+        self._face_matrix_mtime = None
         self.embedding_method = None  # Track which method was used for stored embeddings
-        self.conn = sqlite3.connect('attendance.db', check_same_thread=False)
-        self.load_student_faces()
+        self._session_cfg_cache = {}  # (course_id, session_type) -> (expires_at, (start, end))
+        self._holiday_cache = None  # set of holiday dates, filled lazily
+        self._holiday_cache_strs = None  # same dates as 'YYYY-MM-DD' strings
+        self._holiday_cache_version = None  # _data_version() the holiday cache was filled at
+        self._attendance_cache = {}  # student_id -> (data version, slot attendance result)
+        self._dashboard_stats_cache = None  # (expires_at, cache key, stats dict)
+        self.conn = db_connect('attendance.db', check_same_thread=False)
+        self.read_pool = ConnectionPool('attendance.db')  # for endpoints that run in the threadpool
+        _quality_score(np.zeros((2, 2, 3), dtype=np.uint8), 0, 1, 1, 0)  # JIT warmup
         self.init_extended_tables()
         self.init_advanced_tables()
+        self.load_student_faces(rebuild=False)
     
-    def load_student_faces(self):
-        """Load all student face encodings from database with dimension detection"""
+    def load_student_faces(self, rebuild: bool = True):
+        """Load student face encodings into the shared gallery matrix.
+
+        With rebuild=False an already published known_faces.f32 is mapped as-is (worker
+        startup); otherwise the matrix is rebuilt from the database and republished.
+        """
         if not hasattr(asian_face_recognizer, 'use_insightface') or not asian_face_recognizer.use_insightface:
             print("[WARN]  buffalo_l model not available")
             return
         
         cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name, face_encoding FROM students WHERE status = "active" AND face_encoding IS NOT NULL')
+        if not rebuild and self._map_face_matrix():
+            # The file outlives the process: only trust it if it still covers exactly the
+            # students that have encodings (the DB may have been edited while we were down)
+            cursor.execute('SELECT id FROM students WHERE status = "active" AND face_encoding IS NOT NULL')
+            if sorted(r[0] for r in cursor) == sorted(self.known_face_ids.tolist()):
+                print(f"[STATS] Mapped {len(self.known_face_ids)} student faces from shared gallery")
+                return
+            print("[WARN]  Shared face gallery is out of date, rebuilding from database")
         
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.known_face_ids = []
+        cursor.execute('SELECT id, name, face_encoding FROM students WHERE status = "active" AND face_encoding IS NOT NULL')
         
+        rows = []
         embedding_dimensions = []
         
         for row in cursor.fetchall():
             student_id, name, face_encoding_blob = row
             if face_encoding_blob:
-                face_encoding = np.frombuffer(face_encoding_blob, dtype=np.float64)
+                face_encoding = decode_embedding(face_encoding_blob)
                 embedding_dimensions.append(len(face_encoding))
-                self.known_face_encodings.append(face_encoding)
-                self.known_face_names.append(name)
-                self.known_face_ids.append(student_id)
+                rows.append((student_id, name, face_encoding))
         
         # Detect embedding method based on dimensions
         if embedding_dimensions:
             most_common_dim = max(set(embedding_dimensions), key=embedding_dimensions.count)
             if most_common_dim == 512:
                 self.embedding_method = "insightface"
-                print(f"[STATS] Loaded {len(self.known_face_encodings)} student faces (InsightFace 512D)")
             elif most_common_dim == 128:
                 self.embedding_method = "face_recognition"
-                print(f"[STATS] Loaded {len(self.known_face_encodings)} student faces (face_recognition 128D)")
             else:
                 print(f"[WARN]  Unknown embedding dimension: {most_common_dim}")
                 self.embedding_method = "unknown"
+            
+            # Only embeddings of the dominant dimension can share one matrix
+            # (stored rows are already unit-norm, see init_advanced_tables)
+            rows = [r for r in rows if len(r[2]) == most_common_dim]
+            matrix = np.ascontiguousarray([r[2] for r in rows], dtype=np.float32)
+        else:
+            most_common_dim = 512
+            matrix = np.empty((0, most_common_dim), dtype=np.float32)
+        
+        ids = [r[0] for r in rows]
+        names = [r[1] for r in rows]
+        
+        try:
+            write_face_matrix(matrix, ids, names)
+            if not self._map_face_matrix():
+                raise OSError("published gallery could not be mapped")
+        except OSError as e:
+            print(f"[WARN]  Shared face gallery unavailable, using in-process copy: {e}")
+            self.known_face_matrix = matrix
+            self.known_face_matrix_i8 = quantize_int8(matrix) if SIMSIMD_AVAILABLE else None
+            self.known_face_index = build_ann_index(matrix)
+            self.known_face_ids = np.asarray(ids, dtype=np.int64)
+            self.known_face_names = tuple(names)
+        
+        if ids:
+            print(f"[STATS] Loaded {len(ids)} student faces ({self.embedding_method} {most_common_dim}D)")
         else:
             print("[STATS] No student faces loaded")
     
+    def _map_face_matrix(self):
+        """Map the published gallery file; returns False if there is nothing usable"""
+        mapped = open_face_matrix()
+        if mapped is None:
+            return False
+        self.known_face_matrix, ids, names, self._face_matrix_mtime = mapped
+        # Ids/names as an int64 array and a tuple, indexed by the same row as the matrix
+        self.known_face_ids = np.asarray(ids, dtype=np.int64)
+        self.known_face_names = tuple(names)
+        self.known_face_matrix_i8 = quantize_int8(self.known_face_matrix) if SIMSIMD_AVAILABLE else None
+        self.known_face_index = build_ann_index(self.known_face_matrix)
+        if self.embedding_method is None and len(self.known_face_ids):
+            dim = self.known_face_matrix.shape[1]
+            self.embedding_method = "insightface" if dim == 512 else "face_recognition" if dim == 128 else "unknown"
+        return True
+    
+    def add_to_gallery(self, student_id: int, name: str, face_encoding):
+        """Append one newly registered student (unit-norm encoding) to the shared gallery"""
+        row = np.asarray(face_encoding, dtype=np.float32).reshape(1, -1)
+        
+        def append(matrix, ids, names):
+            if len(ids) and matrix.shape[1] != row.shape[1]:
+                raise ValueError(f"embedding dimension {row.shape[1]} != gallery {matrix.shape[1]}")
+            matrix = np.concatenate([matrix, row]) if len(ids) else row
+            return matrix, ids + [student_id], names + [name]
+        
+        self._update_gallery(append)
+    
+    def remove_from_gallery(self, student_id: int):
+        """Drop a student's row from the shared gallery"""
+        def remove(matrix, ids, names):
+            keep = np.asarray(ids) != student_id
+            return (matrix[keep],
+                    [i for i, k in zip(ids, keep) if k],
+                    [n for n, k in zip(names, keep) if k])
+        
+        self._update_gallery(remove)
+    
+    def _update_gallery(self, transform):
+        """Apply an incremental change to the published gallery, rebuilding from the DB if that fails"""
+        if not hasattr(asian_face_recognizer, 'use_insightface') or not asian_face_recognizer.use_insightface:
+            return
+        try:
+            if update_face_matrix(transform) and self._map_face_matrix():
+                print(f"[STATS] Gallery updated - {len(self.known_face_ids)} student faces")
+                return
+        except (OSError, ValueError) as e:
+            print(f"[WARN]  Incremental gallery update failed, rebuilding: {e}")
+        self.load_student_faces()
+    
+    def _refresh_face_matrix(self):
+        """Remap the gallery if another worker republished it (registration, edit, delete)"""
+        mtime = face_matrix_mtime()
+        if mtime is not None and mtime != self._face_matrix_mtime:
+            self._map_face_matrix()
+    
+    def find_best_match(self, face_encoding):
+        """Match an embedding against all registered students: returns (id, name, similarity) or None"""
+        self._refresh_face_matrix()
+        match = best_match(self.known_face_matrix, face_encoding, self.known_face_matrix_i8)
+        if match is None:
+            return None
+        index, similarity = match
+        return int(self.known_face_ids[index]), self.known_face_names[index], similarity
+    
+    def find_best_matches(self, face_encodings, threshold: float = None):
+        """Match every detected face in one batch: returns [(id, name, similarity) or None, ...]
+
+        With a threshold, faces whose best similarity doesn't exceed it are returned as None.
+        """
+        self._refresh_face_matrix()
+        return [None if match is None else
+                (int(self.known_face_ids[match[0]]), self.known_face_names[match[0]], match[1])
+                for match in best_matches(self.known_face_matrix, face_encodings, self.known_face_matrix_i8,
+                                          threshold=threshold, ann_index=self.known_face_index)]
+    
     def start_registration_session(self, name: str, email: str, student_id: str):
         """Start a new registration session"""
         session_id = str(uuid.uuid4())
@@ -327,18 +580,8 @@ class AttendanceSystem:
             return None, "Face recognition not available - using basic mode"
         
         try:
-            # Convert base64 to image
-            if image_data.startswith('data:image'):
-                image_data = image_data.split(',')[1]
-            
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            image_array = np.array(image)
+            # Convert base64 to image (RGB)
+            image_array = decode_image_rgb(image_data)
             
             # Use buffalo_l for registration (same as detection)
             detected_faces = asian_face_recognizer.detect_faces_optimized(image_array)
@@ -365,13 +608,8 @@ class AttendanceSystem:
             print(f"[DEBUG] Registration face encoding: {face_encoding[:10]} ... (truncated)")
             
             # Calculate quality score
-            face_location = face_locations[0]
-            face_height = face_location[2] - face_location[0]
-            face_width = face_location[1] - face_location[3]
-            face_area = face_height * face_width
-            
-            image_area = image_array.shape[0] * image_array.shape[1]
-            quality_score = min(face_area / image_area * 100, 10.0)
+            top, right, bottom, left = face_locations[0]
+            quality_score = float(_quality_score(image_array, top, right, bottom, left))
             
             # Get student info for organized storage
             cursor = self.conn.cursor()
@@ -386,12 +624,13 @@ class AttendanceSystem:
                 # Save image in organized directory structure
                 timestamp = str(int(datetime.now().timestamp()))
                 photo_path = get_student_photo_path(student_id, student_name, session_id, timestamp)
-                image.save(photo_path, 'JPEG', quality=90)
             else:
                 # Fallback to old method
                 photo_filename = f"{session_id}_{datetime.now().timestamp()}.jpg"
                 photo_path = os.path.join('student_photos', photo_filename)
-                image.save(photo_path, 'JPEG', quality=90)
+            
+            # Encode here, write in the background; the path is returned right away
+            _IO_POOL.submit(_write_file, photo_path, encode_jpeg(image_array, quality=90))
             
             return {
                 'encoding': face_encoding,
@@ -423,7 +662,7 @@ class AttendanceSystem:
             existing = []
         
         existing.append({
-            'encoding': encoding_data['encoding'].tolist(),
+            'encoding': np.asarray(encoding_data['encoding'], dtype=np.float64),
             'quality_score': encoding_data['quality_score'],
             'photo_path': encoding_data['photo_path']
         })
@@ -466,22 +705,20 @@ class AttendanceSystem:
             
             encodings_data = np.load(temp_file, allow_pickle=True).tolist()
             
-            # Calculate average encoding
-            encodings = [np.array(item['encoding']) for item in encodings_data]
-            average_encoding = np.mean(encodings, axis=0)
+            # Calculate average encoding, stored L2-normalized so matching is a plain dot product
+            encodings = np.stack([np.asarray(item['encoding'], dtype=np.float64) for item in encodings_data])
+            average_encoding = encodings.mean(axis=0)
+            average_encoding = average_encoding / np.linalg.norm(average_encoding)
             
-            # Calculate verification score
-            if FACE_RECOGNITION_AVAILABLE:
-                # Use cosine distance for InsightFace
-                distances = []
-                for encoding in encodings:
-                    face_norm = encoding / np.linalg.norm(encoding)
-                    avg_norm = average_encoding / np.linalg.norm(average_encoding)
-                    similarity = np.dot(face_norm, avg_norm)
-                    distances.append(1.0 - similarity)
-                verification_score = 1.0 - np.mean(distances)
-            else:
-                verification_score = 0.8  # Default score
+            # Calculate verification score (cosine distance for InsightFace, all photos at once)
+            E = encodings.astype(np.float32)
+            E /= np.linalg.norm(E, axis=1, keepdims=True)
+            distances = 1.0 - E @ average_encoding.astype(np.float32)
+            verification_score = float(1.0 - distances.mean())
+            
+            # Student row, its per-photo encodings and the session update commit together
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
             
             # Insert student
             cursor.execute('''
@@ -492,25 +729,22 @@ class AttendanceSystem:
                 student_data['student_id'],
                 student_data['name'],
                 student_data['email'],
-                average_encoding.tobytes(),
+                encode_embedding(average_encoding),
                 photos_uploaded,
                 verification_score
             ))
             
             new_student_id = cursor.lastrowid
             
-            # Insert individual encodings
-            for encoding_item in encodings_data:
-                cursor.execute('''
-                    INSERT INTO face_encodings 
-                    (student_id, encoding_data, photo_path, quality_score)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    new_student_id,
-                    np.array(encoding_item['encoding']).tobytes(),
-                    encoding_item['photo_path'],
-                    encoding_item['quality_score']
-                ))
+            # Insert individual encodings (float32 BLOBs, like the student's average)
+            cursor.executemany('''
+                INSERT INTO face_encodings 
+                (student_id, encoding_data, photo_path, quality_score)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (new_student_id, encode_embedding(encoding), item['photo_path'], item['quality_score'])
+                for encoding, item in zip(encodings, encodings_data)
+            ])
             
             # Mark session completed
             cursor.execute('''
@@ -521,8 +755,8 @@ class AttendanceSystem:
             
             self.conn.commit()
             
-            # Reload student faces
-            self.load_student_faces()
+            # Add the new student to the face gallery
+            self.add_to_gallery(new_student_id, student_data['name'], average_encoding)
             
             # Clean up
             if os.path.exists(temp_file):
@@ -531,6 +765,8 @@ class AttendanceSystem:
             return True, f"Registration completed for {student_data['name']}"
             
         except Exception as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
             return False, f"Registration failed: {str(e)}"
         
     def init_extended_tables(self):
@@ -567,6 +803,9 @@ class AttendanceSystem:
             cursor.execute('ALTER TABLE attendance ADD COLUMN is_manual BOOLEAN DEFAULT FALSE')
         except Exception:
             pass  # Column already exists
+        # Per-student daily lookups; slot_attendance (student_id, date, slot_id) and
+        # holidays(date) are already covered by their UNIQUE constraints
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance(student_id, date)')
         self.conn.commit()
     
     def init_advanced_tables(self):
@@ -617,6 +856,7 @@ class AttendanceSystem:
                 UNIQUE(student_id, course_id, session_type, date)
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sa_student_date ON session_attendance(student_id, date, session_type)')
         
         # Add columns to existing attendance table
         try:
@@ -659,7 +899,25 @@ class AttendanceSystem:
                     course_id, 'afternoon_2', '16:15:00', '16:45:00'
             ))
         
+        # Stored student embeddings are kept unit-norm float32; rewrite rows saved before
+        # that (un-normalized, or float64 BLOBs)
+        cursor.execute('SELECT id, face_encoding FROM students WHERE face_encoding IS NOT NULL')
+        normalized_rows = []
+        for student_pk, encoding_blob in cursor.fetchall():
+            encoding = decode_embedding(encoding_blob)
+            norm = np.linalg.norm(encoding)
+            if norm > 0 and (abs(norm - 1.0) > 1e-3 or encoding.nbytes != len(encoding_blob)):
+                normalized_rows.append((encode_embedding(encoding / norm), student_pk))
+        if normalized_rows:
+            cursor.executemany('UPDATE students SET face_encoding = ? WHERE id = ?', normalized_rows)
+            print(f"[OK] Normalized {len(normalized_rows)} stored face encodings")
+        
         self.conn.commit()
+        
+        # Give the query planner statistics for the composite indexes: full ANALYZE the
+        # first time, afterwards PRAGMA optimize only re-analyzes tables that need it
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        cursor.execute('PRAGMA optimize' if cursor.fetchone() else 'ANALYZE')
 
     def get_active_course(self):
         """Get the currently active course"""
@@ -683,63 +941,38 @@ class AttendanceSystem:
         if not course:
             return False
         
+        session_window = self.get_session_window(course[0], session_type)
+        if not session_window:
+            return False
+        
+        start_time, end_time = session_window
+        return start_time <= current_time <= end_time
+
+    def get_session_window(self, course_id: int, session_type: str):
+        """Get (start_time, end_time) for a session as parsed time objects, cached per course"""
+        cache_key = (course_id, session_type)
+        cached = self._session_cfg_cache.get(cache_key)
+        if cached and cached[0] > monotonic():
+            return cached[1]
+        
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT start_time, end_time
-if __name__ == "__main__":
-    import uvicorn
-    import os
-    import subprocess
-    
-    # SSL certificate files
-    cert_file = "cert.pem"
-    key_file = "key.pem"
-    
-    # Generate self-signed certificate if it doesn't exist
-    if not os.path.exists(cert_file) or not os.path.exists(key_file):
-        print("🔧 Generating SSL certificates...")
-        try:
-            # Create self-signed certificate
-            subprocess.run([
-                "openssl", "req", "-x509", "-newkey", "rsa:4096", 
-                "-keyout", key_file, "-out", cert_file, "-days", "365", "-nodes",
-                "-subj", "/C=IN/ST=Maharashtra/L=Mumbai/O=CDAC/CN=10.212.13.129"
-            ], check=True)
-            print("[OK] SSL certificates generated!")
-        except subprocess.CalledProcessError:
-            print("[ERROR] Failed to generate SSL certificates. Install OpenSSL first.")
-            print("[STATS] Running on HTTP: http://10.212.13.129:8000/")
-            uvicorn.run("main_with_face_recognition:app", host="10.212.13.129", port=8000)
-            exit()
-    
-    # Run with HTTPS
-    print("🔒 HTTPS Dashboard: https://10.212.13.129:8000/")
-    print("[WARN]  You may see a security warning - click 'Advanced' → 'Proceed to 10.212.13.129 (unsafe)'")
-    print("💡 Tip: Bookmark the HTTPS URL to avoid the warning next time")
-    
-    try:
-        uvicorn.run(
-            "main_with_face_recognition:app", 
-            host="10.212.13.129", 
-            port=8000,
-            ssl_keyfile=key_file,
-            ssl_certfile=cert_file
-        )
-    except Exception as e:
-        print(f"[ERROR] HTTPS failed: {e}")
-        print("[STATS] Falling back to HTTP: http://10.212.13.129:8000/")
-        uvicorn.run("main_with_face_recognition:app", host="10.212.13.129", port=8000)            FROM session_configs
+            FROM session_configs
             WHERE course_id = ? AND session_type = ? AND is_active = TRUE
-        ''', (course[0], session_type))
+        ''', (course_id, session_type))
         
         session_config = cursor.fetchone()
-        if not session_config:
-            return False
-        
-        start_time = datetime.strptime(session_config[0], '%H:%M:%S').time()
-        end_time = datetime.strptime(session_config[1], '%H:%M:%S').time()
+        if session_config:
+            session_window = (
+                datetime.strptime(session_config[0], '%H:%M:%S').time(),
+                datetime.strptime(session_config[1], '%H:%M:%S').time()
+            )
+        else:
+            session_window = None
         
-        return start_time <= current_time <= end_time
+        self._session_cfg_cache[cache_key] = (monotonic() + SESSION_CONFIG_CACHE_TTL, session_window)
+        return session_window
 
     def get_session_attendance_today(self, session_type: str):
         """Get today's attendance for a specific session"""
@@ -785,12 +1018,19 @@ if __name__ == "__main__":
                 course_id, 'afternoon_2', '16:15:00', '16:45:00'
             ))
             
+            self._session_cfg_cache.clear()
+            
         except Exception as e:
             return False, f"Failed to create course: {str(e)}"
 
     def get_student_slot_attendance_data(self, student_id: int):
         """Get comprehensive slot-based attendance data for a specific student"""
-        from datetime import date, timedelta, datetime
+        # Reuse the last result while nothing has been written to the database and it's the same day
+        data_version = self._data_version()
+        cached = self._attendance_cache.get(student_id)
+        if cached and cached[0] == data_version:
+            return cached[1]
+        
         cursor = self.conn.cursor()
 
         print(f"DEBUG: get_student_slot_attendance_data() - slot-based version")
@@ -799,17 +1039,9 @@ if __name__ == "__main__":
         # Get student joining date
         cursor.execute("SELECT joining_date FROM students WHERE id = ?", (student_id,))
         joining_row = cursor.fetchone()
-        
-        if joining_row and joining_row[0]:
-            try:
-                start_date = datetime.strptime(joining_row[0], '%Y-%m-%d').date()
-            except:
-                start_date = date(2025, 1, 1)  # Start of year if parsing fails
-        else:
-            start_date = date(2025, 1, 1)  
+        start_date = self._slot_start_date(joining_row[0] if joining_row else None)
 
-        timezone = pytz.timezone('Asia/Kolkata')
-        end_date = datetime.now(timezone).date()  # Ensure end_date is in the correct timezone
+        end_date = datetime.now(IST).date()  # Ensure end_date is in the correct timezone
         print(f"[DEBUG] Date range: {start_date} to {end_date}")
 
         # Get slot attendance records (the working data)
@@ -819,81 +1051,72 @@ if __name__ == "__main__":
             WHERE student_id = ?
             ORDER BY date, slot_id
         """, (student_id,))
-        slot_records = cursor.fetchall()
-        print(f"[DEBUG] Found {len(slot_records)} slot records")
 
-        # Get holidays
-        cursor.execute("SELECT date, name, type FROM holidays ORDER BY date")
-        holidays = cursor.fetchall()
-        holiday_dates = []
-        for h in holidays:
+        # The cursor is consumed row by row; no intermediate list of records
+        result = self._build_slot_attendance(start_date, end_date, cursor)
+        stats = result['stats']
+        print(f"[DEBUG] Stats - Full days: {stats['full_days']}, Partial days: {stats['half_days']}, Absent: {stats['absent_days']}, Total working: {stats['total_working_days']}, Percentage: {stats['percentage']:.1f}%")
+        self._attendance_cache[student_id] = (data_version, result)
+        return result
+
+    def _data_version(self):
+        """Token that changes whenever attendance data may have changed.
+
+        PRAGMA data_version moves when another connection (slot manager, other workers)
+        commits; total_changes moves on writes through this connection; the date rolls
+        the working-day range over at midnight.
+        """
+        other_writes = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        return other_writes, self.conn.total_changes, datetime.now(IST).date()
+
+    @staticmethod
+    def _slot_start_date(joining_date):
+        """First day counted for slot attendance: the joining date, else start of 2025"""
+        from datetime import date
+        if joining_date:
             try:
-                holiday_dates.append(datetime.strptime(h[0], '%Y-%m-%d').date())
-            except:
-                continue
+                return date.fromisoformat(joining_date)
+            except (TypeError, ValueError):
+                pass  # Start of year if parsing fails
+        return date(2025, 1, 1)
 
-        # Process slot data
-        attendance_dict = {}
-        slot_summary = {}
-        
-        for record in slot_records:
-            date_str, slot_id, time_marked = record
-            
-            if date_str not in slot_summary:
-                slot_summary[date_str] = {}
-            
-            slot_summary[date_str][slot_id] = time_marked
+    def _build_slot_attendance(self, start_date, end_date, slot_records):
+        """Calendar map and stats from one student's (date, slot_id, time_marked) rows"""
+        from datetime import date
+
+        # Get holidays
+        holiday_dates, holiday_strs = self._get_holidays_cached()
 
-        # Calculate attendance for each day
+        # Working days (everything except Sundays and holidays) are counted arithmetically;
+        # only days with attendance are walked. Days without an entry are absent and the
+        # calendar fills those in itself.
+        total_working_days = self._count_working_days(start_date, end_date, holiday_dates)
+        holidays_in_range = sum(1 for d in holiday_dates if start_date <= d <= end_date)
         full_days = 0
         partial_days = 0
-        total_working_days = 0
+        total_slots_attended = 0
+        attendance_with_sessions = {}
         
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            
-            # Skip only Sunday (weekday() == 6) and holidays
-            if current_date.weekday() == 6 or current_date in holiday_dates:
-                current_date += timedelta(days=1)
+        # Rows are ordered by date, so each day's slots are grouped and classified in one pass
+        for date_str, day_rows in groupby(slot_records, key=itemgetter(0)):
+            try:
+                day = date.fromisoformat(date_str)
+            except (TypeError, ValueError):
+                continue
+            if day < start_date or day > end_date or day.weekday() == 6 or date_str in holiday_strs:
                 continue
-                    
-            total_working_days += 1
             
-            if date_str in slot_summary:
-                sessions = slot_summary[date_str]
-                slot_count = len([s for s in sessions.keys() if s.startswith('morning') or s.startswith('afternoon')])
-                
-                if slot_count == 4:
-                    attendance_dict[date_str] = 'present'  # Full day
-                    full_days += 1
-                elif slot_count > 0:
-                    attendance_dict[date_str] = 'partial'  # Partial day
-                    partial_days += 1
-                else:
-                    attendance_dict[date_str] = 'absent'
+            sess = {slot_id: time_marked for _, slot_id, time_marked in day_rows}
+            slot_count = sum(1 for s in sess if s.startswith(('morning', 'afternoon')))
+            if slot_count == 4:
+                status = 'present'  # Full day
+                full_days += 1
+            elif slot_count > 0:
+                status = 'partial'  # Partial day
+                partial_days += 1
             else:
-                attendance_dict[date_str] = 'absent'
-                
-            current_date += timedelta(days=1)
-
-        absent_days = total_working_days - full_days - partial_days
-        
-        # Calculate percentage based on total slots attended
-        total_slots_attended = sum(
-            len([s for s in slot_summary.get(d, {}).keys() if s.startswith('morning') or s.startswith('afternoon')]) 
-            for d in attendance_dict.keys()
-        )
-        expected_slots = total_working_days * 4
-        attendance_percentage = (total_slots_attended / expected_slots * 100) if expected_slots > 0 else 0
-
-        print(f"[DEBUG] Stats - Full days: {full_days}, Partial days: {partial_days}, Absent: {absent_days}, Total working: {total_working_days}, Percentage: {attendance_percentage:.1f}%")
-
-        # Add session details to attendance_dict for calendar display
-        attendance_with_sessions = {}
-        for date_str, status in attendance_dict.items():
-            sess = slot_summary.get(date_str, {})
-            slot_count = len([s for s in sess.keys() if s.startswith('morning') or s.startswith('afternoon')])
+                status = 'absent'
+            total_slots_attended += slot_count
             
             attendance_with_sessions[date_str] = {
                 'status': status,
@@ -904,6 +1127,12 @@ if __name__ == "__main__":
                 'a2': sess.get('afternoon_2')
             }
 
+        absent_days = total_working_days - full_days - partial_days
+        
+        # Calculate percentage based on total slots attended
+        expected_slots = total_working_days * 4
+        attendance_percentage = (total_slots_attended / expected_slots * 100) if expected_slots > 0 else 0
+
         return {
             'success': True,
             'attendance': attendance_with_sessions,
@@ -911,79 +1140,60 @@ if __name__ == "__main__":
                 'full_days': full_days,
                 'half_days': partial_days,  # Kept as half_days to not break frontend var name blindly
                 'absent_days': absent_days,
-                'holidays': len(holiday_dates),
+                'holidays': holidays_in_range,
                 'percentage': round(attendance_percentage, 1),
                 'total_working_days': total_working_days
             }
         }
 
-
+    @staticmethod
+    def _count_working_days(start_date, end_date, holiday_dates):
+        """Days in [start_date, end_date] that are neither Sundays nor holidays, without a per-day loop"""
+        if start_date > end_date:
+            return 0
+        total_days = (end_date - start_date).days + 1
+        first_sunday = start_date + timedelta(days=(6 - start_date.weekday()) % 7)
+        sundays = (end_date - first_sunday).days // 7 + 1 if first_sunday <= end_date else 0
+        weekday_holidays = sum(
+            1 for d in holiday_dates
+            if start_date <= d <= end_date and d.weekday() != 6
+        )
+        return total_days - sundays - weekday_holidays
 
     def get_today_attendance(self):
         """Get today's session-based attendance with proper timezone handling"""
-        timezone = pytz.timezone('Asia/Kolkata')  # Ensure to use your desired timezone
-        today = datetime.now(timezone).date()  # Localize to the right timezone
+        today = datetime.now(IST).date()  # Localize to the right timezone
         cursor = self.conn.cursor()
 
         cursor.execute('''
             SELECT s.name, s.student_id, s.email, 
-                sa_morning.arrival_time as morning_time,
-                sa_afternoon.arrival_time as afternoon_time
+                MAX(CASE WHEN sa.session_type = 'morning' THEN sa.arrival_time END) as morning_time,
+                MAX(CASE WHEN sa.session_type = 'afternoon' THEN sa.arrival_time END) as afternoon_time
             FROM students s
-            LEFT JOIN session_attendance sa_morning ON s.id = sa_morning.student_id 
-                AND sa_morning.date = ? AND sa_morning.session_type = 'morning'
-            LEFT JOIN session_attendance sa_afternoon ON s.id = sa_afternoon.student_id 
-                AND sa_afternoon.date = ? AND sa_afternoon.session_type = 'afternoon'
+            LEFT JOIN session_attendance sa ON sa.student_id = s.id AND sa.date = ?
             WHERE s.status = 'active'
+            GROUP BY s.id
             ORDER BY s.name
-        ''', (today, today))
+        ''', (today,))
 
         return cursor.fetchall()
 
     
     def mark_manual_session_attendance(self, student_id: int, date_str: str, session_type: str, reason: str = None):
         """Mark session attendance manually - FIXED to use slot_attendance and handle full day"""
-        cursor = self.conn.cursor()
-        
         # Check if holiday
-        cursor.execute('SELECT id FROM holidays WHERE date = ?', (date_str,))
-        if cursor.fetchone():
+        if date_str in self._get_holidays_cached()[1]:
             return False, "Cannot mark attendance on a holiday"
         
-        timezone = pytz.timezone('Asia/Kolkata')
-        now = datetime.now(timezone)
-        current_time = now.strftime('%H:%M:%S')
-        current_timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
-
         slots_to_mark = []
         if session_type == 'full_day':
             slots_to_mark = ['morning_1', 'morning_2', 'afternoon_1', 'afternoon_2']
         else:
             slots_to_mark = [session_type]
-            
-        marked_count = 0
-        already_marked = 0
-        
-        for slot in slots_to_mark:
-            # Check if already marked for this session in slot_attendance
-            cursor.execute('''
-                SELECT id FROM slot_attendance 
-                WHERE student_id = ? AND date = ? AND slot_id = ?
-            ''', (student_id, date_str, slot))
-            
-            if cursor.fetchone():
-                already_marked += 1
-                continue
-            
-            # Mark session attendance in slot_attendance table
-            cursor.execute('''
-                INSERT INTO slot_attendance 
-                (student_id, date, slot_id, time_marked, is_manual, manual_reason, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (student_id, date_str, slot, current_time, True, reason, current_timestamp))
-            marked_count += 1
         
-        self.conn.commit()
+        # All slots in one executemany/transaction; skipped ones were already marked
+        marked_count, already_marked = self.mark_manual_session_attendance_bulk(
+            (student_id, date_str, slot, reason) for slot in slots_to_mark)
         
         if marked_count > 0:
             msg = f"Successfully marked {marked_count} session(s)"
@@ -992,6 +1202,42 @@ if __name__ == "__main__":
             return True, msg
         else:
             return False, "All selected sessions were already marked for this date"
+    
+    def mark_manual_session_attendance_bulk(self, rows):
+        """Mark many manual slots at once.
+
+        rows: iterable of (student_id, date_str, slot_id, reason). Holiday dates are skipped;
+        everything else goes through one executemany inside a single write transaction.
+        Returns (marked_count, skipped_count).
+        """
+        holiday_strs = self._get_holidays_cached()[1]
+        now = datetime.now(IST)
+        current_time = now.strftime('%H:%M:%S')
+        current_timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+        
+        params = []
+        skipped = 0
+        for student_id, date_str, slot_id, reason in rows:
+            if date_str in holiday_strs:
+                skipped += 1
+                continue
+            params.append((student_id, date_str, slot_id, current_time, True, reason, current_timestamp))
+        
+        if not params:
+            return 0, skipped
+        
+        cursor = self.conn.cursor()
+        try:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN IMMEDIATE")
+            cursor.executemany(SLOT_MANUAL_INSERT_SQL, params)
+            marked_count = cursor.rowcount
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        
+        return marked_count, skipped + len(params) - marked_count
         
     def get_student_count(self):
         """Get total number of active students"""
@@ -1008,10 +1254,35 @@ if __name__ == "__main__":
             cursor.execute('INSERT INTO holidays (date, name, type) VALUES (?, ?, ?)',
                           (date_str, name, holiday_type))
             self.conn.commit()
+            self._holiday_cache = None
             return True, "Holiday added successfully"
         except Exception as e:
             return False, f"Holiday already exists: {str(e)}"
 
+    def _get_holidays_cached(self, conn=None):
+        """Holiday dates as (set of date, set of 'YYYY-MM-DD'), cached until the database changes
+
+        Keyed on the same data version as _attendance_cache, so holidays edited by another
+        worker or script are picked up before the attendance cache recomputes with them.
+        """
+        data_version = self._data_version()
+        holiday_dates, holiday_strs = self._holiday_cache, self._holiday_cache_strs
+        if holiday_dates is None or self._holiday_cache_version != data_version:
+            from datetime import date
+            cursor = (conn or self.conn).cursor()
+            cursor.execute('SELECT date FROM holidays')
+            holiday_dates = set()
+            for h in cursor.fetchall():
+                try:
+                    holiday_dates.add(date.fromisoformat(h[0]))
+                except (TypeError, ValueError):
+                    continue
+            holiday_strs = {d.isoformat() for d in holiday_dates}
+            self._holiday_cache_strs = holiday_strs
+            self._holiday_cache = holiday_dates
+            self._holiday_cache_version = data_version
+        return holiday_dates, holiday_strs
+
     def get_holidays(self):
         """Get all holidays"""
         cursor = self.conn.cursor()
@@ -1040,8 +1311,8 @@ if __name__ == "__main__":
         
         if joining_row and joining_row[0]:
             try:
-                start_date = datetime.strptime(joining_row[0], '%Y-%m-%d').date() + timedelta(days=1)
-            except:
+                start_date = date.fromisoformat(joining_row[0]) + timedelta(days=1)
+            except (TypeError, ValueError):
                 start_date = date.today()
         else:
             start_date = date.today()
@@ -1050,71 +1321,52 @@ if __name__ == "__main__":
         end_date = date.today()  # Only process up to today, not future dates
         print(f"[DEBUG] Date range: {start_date} to {end_date}")
 
-        # Get session attendance records
+        # Get holidays
+        holiday_dates, holiday_strs = self._get_holidays_cached()
+
+        # Get session attendance records (streamed from the cursor below)
         cursor.execute("""
-            SELECT date, session_type, arrival_time, is_manual, manual_reason
+            SELECT date, session_type, arrival_time
             FROM session_attendance 
             WHERE student_id = ?
             ORDER BY date, session_type
         """, (student_id,))
-        session_records = cursor.fetchall()
-        print(f"[DEBUG] Found {len(session_records)} session records")
-
-        # Get holidays
-        cursor.execute("SELECT date, name, type FROM holidays ORDER BY date")
-        holidays = cursor.fetchall()
-        holiday_dates = []
-        for h in holidays:
-            try:
-                holiday_dates.append(datetime.strptime(h[0], '%Y-%m-%d').date())
-            except:
-                continue
-
-        # Process session data
-        attendance_dict = {}
-        session_summary = {}
-        
-        for record in session_records:
-            date_str, session_type, arrival_time, is_manual, manual_reason = record
-            
-            if date_str not in session_summary:
-                session_summary[date_str] = {}
-            
-            session_summary[date_str][session_type] = arrival_time
 
-        # Calculate attendance for each day
+        # Working days (Saturday included, Sundays and holidays excluded) are counted
+        # arithmetically; only days with attendance are walked
+        total_working_days = self._count_working_days(start_date, end_date, holiday_dates)
+        holidays_in_range = sum(1 for d in holiday_dates if start_date <= d <= end_date)
         full_days = 0
         half_days = 0
-        total_working_days = 0
+        attendance_with_sessions = {}
         
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            
-            # Skip only Sunday (weekday() == 6) and holidays - Saturday is a working day
-            if current_date.weekday() == 6 or current_date in holiday_dates:
-                current_date += timedelta(days=1)
+        # Rows are ordered by date, so each day's sessions are grouped and classified in one pass
+        for date_str, day_rows in groupby(cursor, key=itemgetter(0)):
+            try:
+                day = date.fromisoformat(date_str)
+            except (TypeError, ValueError):
+                continue
+            if day < start_date or day > end_date or day.weekday() == 6 or date_str in holiday_strs:
                 continue
-                
-            total_working_days += 1
             
-            if date_str in session_summary:
-                sessions = session_summary[date_str]
-                has_morning = 'morning' in sessions
-                has_afternoon = 'afternoon' in sessions
-                
-                if has_morning and has_afternoon:
-                    attendance_dict[date_str] = 'present'  # Full day
-                    full_days += 1
-                elif has_morning or has_afternoon:
-                    attendance_dict[date_str] = 'partial'  # Half day
-                    half_days += 1
-                else:
-                    attendance_dict[date_str] = 'absent'
+            sessions = {row[1]: row[2] for row in day_rows}
+            has_morning = 'morning' in sessions
+            has_afternoon = 'afternoon' in sessions
+            
+            if has_morning and has_afternoon:
+                status = 'present'  # Full day
+                full_days += 1
+            elif has_morning or has_afternoon:
+                status = 'partial'  # Half day
+                half_days += 1
             else:
-                attendance_dict[date_str] = 'absent'
-                
-            current_date += timedelta(days=1)
+                status = 'absent'
+            
+            attendance_with_sessions[date_str] = {
+                'status': status,
+                'morning': sessions.get('morning'),
+                'afternoon': sessions.get('afternoon')
+            }
 
         absent_days = total_working_days - full_days - half_days
         
@@ -1124,15 +1376,6 @@ if __name__ == "__main__":
 
         print(f"[DEBUG] Stats - Full days: {full_days}, Half days: {half_days}, Absent: {absent_days}, Total working: {total_working_days}, Percentage: {attendance_percentage:.1f}%")
 
-        # Add session details to attendance_dict for calendar display
-        attendance_with_sessions = {}
-        for date_str, status in attendance_dict.items():
-            attendance_with_sessions[date_str] = {
-                'status': status,
-                'morning': session_summary.get(date_str, {}).get('morning'),
-                'afternoon': session_summary.get(date_str, {}).get('afternoon')
-            }
-
         return {
             'success': True,
             'attendance': attendance_with_sessions,
@@ -1140,7 +1383,7 @@ if __name__ == "__main__":
                 'full_days': full_days,
                 'half_days': half_days,
                 'absent_days': absent_days,
-                'holidays': len(holiday_dates),
+                'holidays': holidays_in_range,
                 'percentage': round(attendance_percentage, 1),
                 'total_working_days': total_working_days
             }
@@ -1156,6 +1399,7 @@ if __name__ == "__main__":
         
         if cursor.rowcount > 0:
             self.conn.commit()
+            self._holiday_cache = None
             return True, "Holiday deleted successfully"
         else:
             return False, "Holiday not found"
@@ -1205,9 +1449,6 @@ async def root(request: Request, session: Optional[Dict[str, Any]] = Depends(get
     """Smart root route with session checking"""
     from fastapi.responses import RedirectResponse
     
-    # Clean up expired sessions
-    SessionManager.cleanup_expired_sessions()
-    
     # If user has valid session, redirect based on type
     if session:
         user_type = session.get("user_type", "")
@@ -1346,18 +1587,7 @@ async def simple_face_login(login_data: SimpleFaceLogin, response: Response):
             }
         
         # Convert base64 to image
-        if login_data.image_data.startswith('data:image'):
-            image_data_clean = login_data.image_data.split(',')[1]
-        else:
-            image_data_clean = login_data.image_data
-        
-        image_bytes = base64.b64decode(image_data_clean)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        image_array = np.array(image)
+        image_array = decode_image_rgb(login_data.image_data)
         
         # Use your existing face detection
         detected_faces = asian_face_recognizer.detect_faces_optimized(image_array)
@@ -1379,23 +1609,11 @@ async def simple_face_login(login_data: SimpleFaceLogin, response: Response):
         face_encoding = detected_faces[0]['embedding']
         
         # Find best match using your existing system
-        if len(attendance_system.known_face_encodings) > 0:
-            similarities = []
-            for known_encoding in attendance_system.known_face_encodings:
-                face_norm = face_encoding / np.linalg.norm(face_encoding)
-                known_norm = known_encoding / np.linalg.norm(known_encoding)
-                similarity = np.dot(face_norm, known_norm)
-                similarities.append(similarity)
-            
-            best_match_index = np.argmax(similarities)
-            best_similarity = similarities[best_match_index]
-            
-            RECOGNITION_THRESHOLD = 0.60
+        match = attendance_system.find_best_match(face_encoding)
+        if match is not None:
+            student_id, student_name, best_similarity = match
             
             if best_similarity > RECOGNITION_THRESHOLD:
-                student_id = attendance_system.known_face_ids[best_match_index]
-                student_name = attendance_system.known_face_names[best_match_index]
-                
                 # Create session for face login
                 user_info = {
                     "id": student_id,
@@ -1465,25 +1683,32 @@ async def admin_dashboard(request: Request, session: Dict[str, Any] = Depends(re
 
 # Add these routes to your FastAPI app (replace the incomplete Flask ones)
 
-@app.get("/about", response_class=HTMLResponse)
-async def about_page():
-    """About Us page"""
+def _read_static_page(name: str) -> Optional[str]:
+    """Read a plain HTML page from templates/ (None if it's missing)"""
     try:
-        # Fixed path: files are in templates/ folder
-        with open('templates/about.html', 'r', encoding='utf-8') as f:
+        with open(f'templates/{name}.html', 'r', encoding='utf-8') as f:
             return f.read()
     except FileNotFoundError:
+        return None
+
+# about/contact are static HTML (no Jinja context), so read them once at startup
+_STATIC_PAGES = {name: _read_static_page(name) for name in ('about', 'contact')}
+
+@app.get("/about", response_class=HTMLResponse)
+async def about_page():
+    """About Us page"""
+    page = _STATIC_PAGES['about']
+    if page is None:
         raise HTTPException(status_code=404, detail="About page not found in templates folder")
+    return page
 
 @app.get("/contact", response_class=HTMLResponse) 
 async def contact_page():
     """Contact Us page"""
-    try:
-        # Fixed path: files are in templates/ folder
-        with open('templates/contact.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
+    page = _STATIC_PAGES['contact']
+    if page is None:
         raise HTTPException(status_code=404, detail="Contact page not found in templates folder")
+    return page
     
 
 @app.get("/register", response_class=HTMLResponse)
@@ -1540,20 +1765,8 @@ async def detect_attendance(image_data: DetectionImage):
         return {"success": False, "message": "Face recognition not available"}
     
     try:
-        # Convert base64 to image
-        if image_data.image_data.startswith('data:image'):
-            image_data_clean = image_data.image_data.split(',')[1]
-        else:
-            image_data_clean = image_data.image_data
-        
-        image_bytes = base64.b64decode(image_data_clean)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        image_array = np.array(image)
+        # Convert base64 to image (RGB)
+        image_array = decode_image_rgb(image_data.image_data)
         
         # Use buffalo_l for detection (same as registration)
         detected_faces = asian_face_recognizer.detect_faces_optimized(image_array)
@@ -1569,12 +1782,16 @@ async def detect_attendance(image_data: DetectionImage):
         unknown_faces = 0
         spoofed_faces = 0
         
-        for face_data in detected_faces:
+        # Match all detected faces against the gallery in one batch
+        matches = attendance_system.find_best_matches([face['embedding'] for face in detected_faces],
+                                                      threshold=RECOGNITION_THRESHOLD)
+        locations = face_location_dicts(detected_faces)
+        
+        for face_data, match, location in zip(detected_faces, matches, locations):
             # --- ANTI-SPOOFING GATE ---
             liveness = anti_spoof_checker.check(image_array, face_data['location'])
             if not liveness['is_real']:
                 spoofed_faces += 1
-                face_location = face_data['location']
                 recognized_students.append({
                     "student_id": None,
                     "name": "SPOOF DETECTED",
@@ -1582,80 +1799,47 @@ async def detect_attendance(image_data: DetectionImage):
                     "status": "spoof_detected",
                     "message": f"Liveness check failed (score: {liveness['score']:.2f})",
                     "liveness_score": liveness['score'],
-                    "location": {
-                        "top": int(face_location[0]),
-                        "right": int(face_location[1]),
-                        "bottom": int(face_location[2]),
-                        "left": int(face_location[3])
-                    }
+                    "location": location
                 })
                 continue
             # --- END ANTI-SPOOFING GATE ---
             
-            face_encoding = face_data['embedding']
+            # Faces below RECOGNITION_THRESHOLD come back from the batch match as None
+            if match is None:
+                unknown_faces += 1
+                continue
+            student_id, student_name, best_similarity = match
             
-            # Find best match
-            if len(attendance_system.known_face_encodings) > 0:
-                # Calculate similarities using dot product (for InsightFace embeddings)
-                similarities = []
-                for known_encoding in attendance_system.known_face_encodings:
-                    # Normalize embeddings
-                    face_norm = face_encoding / np.linalg.norm(face_encoding)
-                    known_norm = known_encoding / np.linalg.norm(known_encoding)
-                    similarity = np.dot(face_norm, known_norm)
-                    similarities.append(similarity)
-                
-                best_match_index = np.argmax(similarities)
-                best_similarity = similarities[best_match_index]
-                
-                # Threshold for recognition (adjust as needed)
-                RECOGNITION_THRESHOLD = 0.60  
-                
-                if best_similarity > RECOGNITION_THRESHOLD:
-                    student_id = attendance_system.known_face_ids[best_match_index]
-                    student_name = attendance_system.known_face_names[best_match_index]
-                    
-                    # Check if already marked today
-                    timezone = pytz.timezone('Asia/Kolkata')
-                    today = datetime.now(timezone).date()
-                    current_time = datetime.now(timezone).strftime('%H:%M:%S')
-                    cursor = attendance_system.conn.cursor()
-                    cursor.execute('SELECT id FROM attendance WHERE student_id = ? AND date = ?', 
-                                 (student_id, today))
-                    
-                    if cursor.fetchone():
-                        status = "already_marked"
-                        message = f"{student_name} already marked present today"
-                    else:
-                        # Mark attendance
-                        cursor.execute('''
-                            INSERT INTO attendance (student_id, date, time_in, is_manual)
-                            VALUES (?, ?, ?, ?)
-                        ''', (student_id, today, datetime.now().time().strftime('%H:%M:%S'), False))
-                        
-                        attendance_system.conn.commit()
-                        status = "marked"
-                        message = f"Attendance marked for {student_name}"
-                    
-                    # Define face_location from face_data['location'] before using it
-                    face_location = face_data['location']
-                    recognized_students.append({
-                        "student_id": student_id,
-                        "name": student_name,
-                        "confidence": float(best_similarity),
-                        "status": status,
-                        "message": message,
-                        "location": {
-                            "top": int(face_location[0]),
-                            "right": int(face_location[1]),
-                            "bottom": int(face_location[2]),
-                            "left": int(face_location[3])
-                        }
-                    })
-                else:
-                    unknown_faces += 1
+            # Check if already marked today
+            now = datetime.now(IST)
+            today = now.date()
+            current_time = now.strftime('%H:%M:%S')
+            cursor = attendance_system.conn.cursor()
+            cursor.execute('SELECT id FROM attendance WHERE student_id = ? AND date = ?', 
+                         (student_id, today))
+            
+            if cursor.fetchone():
+                status = "already_marked"
+                message = f"{student_name} already marked present today"
             else:
-                unknown_faces += 1
+                # Mark attendance
+                cursor.execute('''
+                    INSERT INTO attendance (student_id, date, time_in, is_manual)
+                    VALUES (?, ?, ?, ?)
+                ''', (student_id, today, datetime.now().time().strftime('%H:%M:%S'), False))
+                
+                attendance_system.conn.commit()
+                status = "marked"
+                message = f"Attendance marked for {student_name}"
+            
+            recognized_students.append({
+                "student_id": student_id,
+                "name": student_name,
+                "confidence": float(best_similarity),
+                "status": status,
+                "message": message,
+                "location": location
+            })
         
         return {
             "success": True,
@@ -1732,7 +1916,7 @@ async def get_system_status():
         "face_recognition_available": FACE_RECOGNITION_AVAILABLE,
         "opencv_available": OPENCV_AVAILABLE,
         "database_connected": True,
-        "students_loaded": len(attendance_system.known_face_encodings)
+        "students_loaded": len(attendance_system.known_face_ids)
     }
 
 @app.get("/api/students/list")
@@ -1776,15 +1960,21 @@ async def get_dashboard_stats():
     """Get dashboard statistics"""
     try:
         today = datetime.now().date().strftime('%Y-%m-%d')
-        cursor = attendance_system.conn.cursor()
         
-        # Get total students
-        cursor.execute('SELECT COUNT(*) FROM students WHERE status = "active"')
-        total_students = cursor.fetchone()[0]
+        # The frontend polls this; reuse the last answer while nothing was written
+        cache_key = (today, attendance_system._data_version())
+        cached = attendance_system._dashboard_stats_cache
+        if cached is not None and cached[0] > monotonic() and cached[1] == cache_key:
+            return {"success": True, "stats": cached[2]}
         
-        # Get today's attendance count
-        cursor.execute('SELECT COUNT(*) FROM attendance WHERE date = ?', (today,))
-        present_today = cursor.fetchone()[0]
+        cursor = attendance_system.conn.cursor()
+        
+        # Total students and today's attendance count in one round-trip
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM students WHERE status = "active"),
+                   (SELECT COUNT(*) FROM attendance WHERE date = ?)
+        ''', (today,))
+        total_students, present_today = cursor.fetchone()
         
         # Calculate stats
         absent_today = total_students - present_today
@@ -1792,14 +1982,17 @@ async def get_dashboard_stats():
         
         print(f"Dashboard stats: Total={total_students}, Present={present_today}, Absent={absent_today}, Rate={attendance_rate}%")
         
+        stats = {
+            "total_students": total_students,
+            "present_today": present_today,
+            "absent_today": absent_today,
+            "attendance_rate": round(attendance_rate, 1)
+        }
+        attendance_system._dashboard_stats_cache = (monotonic() + DASHBOARD_STATS_CACHE_TTL, cache_key, stats)
+        
         return {
             "success": True,
-            "stats": {
-                "total_students": total_students,
-                "present_today": present_today,
-                "absent_today": absent_today,
-                "attendance_rate": round(attendance_rate, 1)
-            }
+            "stats": stats
         }
         
     except Exception as e:
@@ -1838,7 +2031,7 @@ async def get_holidays_api():
 async def get_session_configuration(session: Dict[str, Any] = Depends(require_admin_access)):
     """Get current session configuration"""
     try:
-        manager = create_slot_manager_instance()
+        manager = attendance_manager
         config = manager.get_session_configs()
         return {"success": True, "config": config}
     except Exception as e:
@@ -1852,7 +2045,7 @@ async def update_session_configuration(
 ):
     """Update session timing configuration"""
     try:
-        manager = create_slot_manager_instance()
+        manager = attendance_manager
         success, message = manager.update_session_timing(
             session_type=session_type,
             start_time=data['start_time'],
@@ -1866,7 +2059,7 @@ async def update_session_configuration(
 async def get_current_slot_info(session: Dict[str, Any] = Depends(require_admin_access)):
     """Get current active slot and next slot information"""
     try:
-        manager = create_slot_manager_instance()
+        manager = attendance_manager
         current_slot = manager.get_current_slot()
         next_slot = manager.get_next_slot()
         
@@ -1883,7 +2076,7 @@ async def get_current_slot_info(session: Dict[str, Any] = Depends(require_admin_
 async def reload_slot_configuration(session: Dict[str, Any] = Depends(require_admin_access)):
     """Reload slot configuration from database"""
     try:
-        manager = create_slot_manager_instance()
+        manager = attendance_manager
         manager.reload_config()
         return {"success": True, "message": "Slot configuration reloaded successfully"}
     except Exception as e:
@@ -1952,8 +2145,11 @@ async def update_student(student_id: int, data: dict = Body(...)):
             return {"success": False, "message": "No fields to update"}
         values.append(student_id)   
         sql = f"UPDATE students SET {', '.join(fields)} WHERE id = ?"
-        cursor.execute(sql, values)
-        attendance_system.conn.commit()
+        with attendance_system.conn:  # commit, or roll back on error
+            cursor.execute(sql, values)
+        if "name" in data:
+            # Gallery names are served from the published index
+            attendance_system.load_student_faces()
         return {"success": True, "message": "Student updated successfully"}
     except Exception as e:
         return {"success": False, "message": str(e)}
@@ -1969,21 +2165,22 @@ async def delete_student(student_id: int):
         student = cursor.fetchone()
         
         if not student:
-            raise HTTPException(status_code=404, detail="Student not found")
+            return {"success": False, "message": "Failed to delete student: Student not found"}
         
-        # Delete student's attendance records
-        cursor.execute('DELETE FROM attendance WHERE student_id = ?', (student_id,))
-        
-        # Delete student's face encodings  
-        cursor.execute('DELETE FROM face_encodings WHERE student_id = ?', (student_id,))
-        
-        # Delete the student
-        cursor.execute('DELETE FROM students WHERE id = ?', (student_id,))
-        
-        attendance_system.conn.commit()
+        # One transaction for the whole cascade: a single commit, and nothing is
+        # left half-deleted if a statement fails
+        with attendance_system.conn:
+            # Delete student's attendance records
+            cursor.execute('DELETE FROM attendance WHERE student_id = ?', (student_id,))
+            
+            # Delete student's face encodings  
+            cursor.execute('DELETE FROM face_encodings WHERE student_id = ?', (student_id,))
+            
+            # Delete the student
+            cursor.execute('DELETE FROM students WHERE id = ?', (student_id,))
         
-        # Reload face encodings after deletion
-        attendance_system.load_student_faces()
+        # Drop the student from the face gallery
+        attendance_system.remove_from_gallery(student_id)
         
         return {"success": True, "message": f"Student {student[0]} deleted successfully"}
         
@@ -2023,6 +2220,15 @@ async def bulk_upload_students(file: UploadFile = File(...), session: Dict[str,
         skipped_count = 0
         errors = []
         
+        # Uniqueness is checked against sets loaded once, then all rows go in with one executemany
+        cursor.execute('SELECT student_id, email FROM students')
+        existing_ids = set()
+        existing_emails = set()
+        for existing_id, existing_email in cursor:
+            existing_ids.add(existing_id)
+            existing_emails.add(existing_email)
+        new_students = []
+        
         for row_num, row in enumerate(reader, start=2):  # start=2 because row 1 is header
             try:
                 student_id = row.get('student_id', '').strip()
@@ -2037,26 +2243,31 @@ async def bulk_upload_students(file: UploadFile = File(...), session: Dict[str,
                     continue
                 
                 # Check if student already exists
-                cursor.execute('SELECT id FROM students WHERE student_id = ?', (student_id,))
-                if cursor.fetchone():
+                if student_id in existing_ids:
                     errors.append(f"Row {row_num}: Student ID '{student_id}' already exists")
                     skipped_count += 1
                     continue
+                if email in existing_emails:
+                    errors.append(f"Row {row_num}: Email '{email}' already exists")
+                    skipped_count += 1
+                    continue
+                existing_ids.add(student_id)
+                existing_emails.add(email)
                 
                 # Insert student without face encoding (will be added during face registration)
-                cursor.execute('''
-                    INSERT INTO students 
-                    (student_id, name, email, joining_date, status)
-                    VALUES (?, ?, ?, ?, 'active')
-                ''', (student_id, name, email, joining_date))
-                
+                new_students.append((student_id, name, email, joining_date))
                 added_count += 1
                 
             except Exception as e:
                 errors.append(f"Row {row_num}: {str(e)}")
                 skipped_count += 1
         
-        attendance_system.conn.commit()
+        with attendance_system.conn:
+            cursor.executemany('''
+                INSERT INTO students 
+                (student_id, name, email, joining_date, status)
+                VALUES (?, ?, ?, ?, 'active')
+            ''', new_students)
         
         # Build response message
         message = f"[OK] Added {added_count} student(s)"
@@ -2094,15 +2305,12 @@ async def get_bulk_upload_template(session: Dict[str, Any] = Depends(require_adm
         return {"success": False, "message": f"Failed to generate template: {str(e)}"}
 
 @app.post("/api/logout")
-async def logout(response: Response, session: Optional[Dict[str, Any]] = Depends(get_current_session)):
+async def logout(response: Response, session_token: Optional[str] = Cookie(None, alias="session_token")):
     """Secure logout with session cleanup"""
     try:
-        if session:
-            # Get session token from cookie
-            session_token = None
-            # In a real scenario, you'd extract this from the request
-            # For now, we'll destroy all expired sessions
-            SessionManager.cleanup_expired_sessions()
+        if session_token:
+            # Drop only the caller's session; expired ones are swept on session creation
+            SessionManager.destroy_session(session_token)
         
         # Clear the session cookie
         response.delete_cookie(
@@ -2129,8 +2337,10 @@ async def logout(response: Response, session: Optional[Dict[str, Any]] = Depends
 
 
 @app.get("/logout")
-async def logout_redirect(response: Response):
+async def logout_redirect(response: Response, session_token: Optional[str] = Cookie(None, alias="session_token")):
     """GET logout route for direct access"""
+    if session_token:
+        SessionManager.destroy_session(session_token)
     response.delete_cookie(key="session_token")
     return RedirectResponse(url="/login")
 
@@ -2197,7 +2407,7 @@ async def mark_manual_session_attendance_api(data: dict = Body(...)):
 
 
 @app.get("/api/attendance/bulk-export")
-async def bulk_export_attendance(
+def bulk_export_attendance(
     start_date: str,
     end_date: str,
     format: str,
@@ -2207,190 +2417,140 @@ async def bulk_export_attendance(
     """Export bulk slot-based attendance data as CSV"""
     try:
         from fastapi.responses import StreamingResponse
-        import csv
         
         start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
         end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        cursor = attendance_system.conn.cursor()
-        
-        # Get all students
-        cursor.execute('SELECT id, name, student_id, email FROM students WHERE status = "active" ORDER BY name')
-        students = cursor.fetchall()
-        
-        # Get holidays if not including them
-        holiday_dates = []
-        if not include_holidays:
-            cursor.execute('SELECT date FROM holidays')
-            holiday_dates = [datetime.strptime(row[0], '%Y-%m-%d').date() for row in cursor.fetchall()]
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        if format == 'daily_summary':  # FIXED: was 'daily'
-            writer.writerow(['Date', 'Day', 'Total Students', 'Full Day Present', 'Half Day Present', 'Absent', 'Morning Sessions', 'Afternoon Sessions'])
+        # Sync endpoint: runs in the threadpool on a pooled connection, so a long export
+        # doesn't hold up the event loop or the shared connection
+        with attendance_system.read_pool.connection() as conn:
+            cursor = conn.cursor()
             
-            current_date = start_date_obj  # FIXED: use _obj version
-            while current_date <= end_date_obj:  # FIXED: use _obj version
-                if not include_weekends and current_date.weekday() == 6:
-                    current_date += timedelta(days=1)
-                    continue
-                
-                if current_date in holiday_dates:
-                    current_date += timedelta(days=1)
-                    continue
-                
-                date_str = current_date.strftime('%Y-%m-%d')
-                day_name = current_date.strftime('%A')
-                
-                # Count morning sessions (FROM SLOT_ATTENDANCE)
-                cursor.execute('''
-                    SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                    WHERE date = ? AND slot_id LIKE 'morning%'
-                ''', (date_str,))
-                morning_count = cursor.fetchone()[0]
-                
-                # Count afternoon sessions (FROM SLOT_ATTENDANCE)
-                cursor.execute('''
-                    SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                    WHERE date = ? AND slot_id LIKE 'afternoon%'
-                ''', (date_str,))
-                afternoon_count = cursor.fetchone()[0]
-                
-                # Count students with both sessions equivalent
-                cursor.execute('''
-                    SELECT student_id FROM slot_attendance 
-                    WHERE date = ? 
-                    GROUP BY student_id 
-                    HAVING SUM(CASE WHEN slot_id LIKE 'morning%' THEN 1 ELSE 0 END) > 0 
-                       AND SUM(CASE WHEN slot_id LIKE 'afternoon%' THEN 1 ELSE 0 END) > 0
-                ''', (date_str,))
-                full_day_records = cursor.fetchall()
-                full_day_count = len(full_day_records)
-                
-                # Total unique students
-                cursor.execute('''
-                    SELECT COUNT(DISTINCT student_id) FROM slot_attendance 
-                    WHERE date = ?
-                ''', (date_str,))
-                total_present_students = cursor.fetchone()[0]
-                half_day_count = total_present_students - full_day_count
-                
-                absent_count = len(students) - total_present_students
-                
-                writer.writerow([
-                    date_str, day_name, len(students),
-                    full_day_count, half_day_count, absent_count,
-                    morning_count, afternoon_count
-                ])
-                
-                current_date += timedelta(days=1)
-                
-        elif format == 'student_summary':  # FIXED: was 'student'
-            writer.writerow(['Student Name', 'Student ID', 'Email', 'Full Days', 'Half Days', 'Absent Days', 'Total Sessions', 'Attendance %'])
+            # Get all students
+            cursor.execute('SELECT id, name, student_id, email FROM students WHERE status = "active" ORDER BY name')
+            students = cursor.fetchall()
             
-            for student in students:
-                student_id, name, student_id_str, email = student
-                
-                # Get slot data for this student (FROM SLOT_ATTENDANCE)
+            # Get holidays if not including them (set membership for the per-day checks)
+            holiday_dates = frozenset()
+            if not include_holidays:
+                holiday_dates = frozenset(attendance_system._get_holidays_cached(conn)[0])
+            
+            # Dates to report on, computed once and shared by every row of the export
+            working_days = [
+                current_date
+                for current_date in (start_date_obj + timedelta(days=offset)
+                                     for offset in range((end_date_obj - start_date_obj).days + 1))
+                if (include_weekends or current_date.weekday() != 6) and current_date not in holiday_dates
+            ]
+            
+            if format == 'student_summary':
+                # Per-student full/half day and session totals for the whole range in one query
+                by_student = defaultdict(lambda: {'full': 0, 'half': 0, 'sessions': 0})
                 cursor.execute('''
-                    SELECT date, 
-                           SUM(CASE WHEN slot_id LIKE 'morning%' THEN 1 ELSE 0 END) as morn_count,
-                           SUM(CASE WHEN slot_id LIKE 'afternoon%' THEN 1 ELSE 0 END) as aft_count
-                    FROM slot_attendance 
-                    WHERE student_id = ? AND date BETWEEN ? AND ?
-                    GROUP BY date
-                ''', (student_id, start_date, end_date))  # FIXED: use string versions
-                
-                daily_sessions = cursor.fetchall()
-                
-                full_days = 0
-                half_days = 0
-                for _, morn, aft in daily_sessions:
-                    if morn > 0 and aft > 0:
-                        full_days += 1
-                    elif morn > 0 or aft > 0:
-                        half_days += 1
-                
-                # Get total session count
+                    SELECT student_id,
+                           MAX(slot_id LIKE 'morning%') AS morn,
+                           MAX(slot_id LIKE 'afternoon%') AS aft,
+                           COUNT(*) AS sessions
+                    FROM slot_attendance
+                    WHERE date BETWEEN ? AND ?
+                    GROUP BY student_id, date
+                ''', (start_date, end_date))
+                for sid, morn, aft, sessions in cursor:
+                    counts = by_student[sid]
+                    counts['sessions'] += sessions
+                    if morn and aft:
+                        counts['full'] += 1
+                    elif morn or aft:
+                        counts['half'] += 1
+            else:  # daily_summary / session_detailed
+                # One aggregate pass for the whole range instead of 4 queries per day
+                by_date = defaultdict(lambda: {'morning': 0, 'afternoon': 0, 'full': 0, 'present': 0})
                 cursor.execute('''
-                    SELECT COUNT(*) FROM slot_attendance 
-                    WHERE student_id = ? AND date BETWEEN ? AND ?
-                ''', (student_id, start_date, end_date))  # FIXED: use string versions
-                total_sessions = cursor.fetchone()[0]
-                
-                # Calculate working days
-                total_working_days = 0
-                current_date = start_date_obj  # FIXED: use _obj version
-                while current_date <= end_date_obj:  # FIXED: use _obj version
-                    if not include_weekends and current_date.weekday() == 6:
-                        current_date += timedelta(days=1)
-                        continue
-                    if current_date in holiday_dates:
-                        current_date += timedelta(days=1)
-                        continue
-                    total_working_days += 1
-                    current_date += timedelta(days=1)
-                
-                absent_days = total_working_days - full_days - half_days
-                effective_present_days = full_days + (half_days * 0.5)
-                percentage = (effective_present_days / total_working_days * 100) if total_working_days > 0 else 0
-                
-                writer.writerow([
-                    name, student_id_str, email,
-                    full_days, half_days, absent_days, total_sessions,
-                    f"{percentage:.1f}%"
-                ])
-                
-        else:  # 'session_detailed' format
-            writer.writerow(['Slot-Based Attendance Summary Report'])
-            writer.writerow(['Date Range', f"{start_date} to {end_date}"])
-            writer.writerow(['Total Students', len(students)])
-            writer.writerow([])
-            writer.writerow(['Date', 'Day', 'Full Day', 'Half Day', 'Absent', 'Morning', 'Afternoon', 'Attendance %'])
-            
-            current_date = start_date_obj  # FIXED: use _obj version
-            while current_date <= end_date_obj:  # FIXED: use _obj version
-                if not include_weekends and current_date.weekday() == 6:
-                    current_date += timedelta(days=1)
-                    continue
-                if current_date in holiday_dates:
-                    current_date += timedelta(days=1)
-                    continue
-                
-                date_str = current_date.strftime('%Y-%m-%d')
-                day_name = current_date.strftime('%A')
-                
-                # Same calculations using slot_attendance
-                cursor.execute('SELECT COUNT(DISTINCT student_id) FROM slot_attendance WHERE date = ? AND slot_id LIKE "morning%"', (date_str,))
-                morning_count = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(DISTINCT student_id) FROM slot_attendance WHERE date = ? AND slot_id LIKE "afternoon%"', (date_str,))
-                afternoon_count = cursor.fetchone()[0]
-                
-                cursor.execute('''SELECT student_id FROM slot_attendance WHERE date = ? GROUP BY student_id HAVING SUM(CASE WHEN slot_id LIKE 'morning%' THEN 1 ELSE 0 END) > 0 AND SUM(CASE WHEN slot_id LIKE 'afternoon%' THEN 1 ELSE 0 END) > 0''', (date_str,))
-                full_day_count = len(cursor.fetchall())
-                
-                cursor.execute('SELECT COUNT(DISTINCT student_id) FROM slot_attendance WHERE date = ?', (date_str,))
-                total_present_students = cursor.fetchone()[0]
-                half_day_count = total_present_students - full_day_count
+                    SELECT date,
+                           COUNT(*) AS present,
+                           SUM(morn) AS morning,
+                           SUM(aft) AS afternoon,
+                           SUM(morn AND aft) AS full_day
+                    FROM (
+                        SELECT date, student_id,
+                               MAX(slot_id LIKE 'morning%') AS morn,
+                               MAX(slot_id LIKE 'afternoon%') AS aft
+                        FROM slot_attendance
+                        WHERE date BETWEEN ? AND ?
+                        GROUP BY date, student_id
+                    )
+                    GROUP BY date
+                ''', (start_date, end_date))
+                for date_str, present, morning, afternoon, full_day in cursor:
+                    by_date[date_str] = {'morning': morning, 'afternoon': afternoon, 'full': full_day, 'present': present}
+        
+        def export_rows():
+            if format == 'daily_summary':  # FIXED: was 'daily'
+                yield ['Date', 'Day', 'Total Students', 'Full Day Present', 'Half Day Present', 'Absent', 'Morning Sessions', 'Afternoon Sessions']
                 
-                absent_count = len(students) - total_present_students
-                effective_present = full_day_count + (half_day_count * 0.5)
-                percentage = (effective_present / len(students) * 100) if len(students) > 0 else 0
+                for current_date in working_days:
+                    date_str = current_date.isoformat()
+                    day_name = current_date.strftime('%A')
+                    counts = by_date[date_str]
+                    
+                    full_day_count = counts['full']
+                    half_day_count = counts['present'] - full_day_count
+                    absent_count = len(students) - counts['present']
+                    
+                    yield [
+                        date_str, day_name, len(students),
+                        full_day_count, half_day_count, absent_count,
+                        counts['morning'], counts['afternoon']
+                    ]
+                    
+            elif format == 'student_summary':  # FIXED: was 'student'
+                yield ['Student Name', 'Student ID', 'Email', 'Full Days', 'Half Days', 'Absent Days', 'Total Sessions', 'Attendance %']
                 
-                writer.writerow([
-                    date_str, day_name, full_day_count, half_day_count, absent_count,
-                    morning_count, afternoon_count, f"{percentage:.1f}%"
-                ])
+                total_working_days = len(working_days)
+                for student in students:
+                    student_id, name, student_id_str, email = student
+                    counts = by_student[student_id]
+                    full_days = counts['full']
+                    half_days = counts['half']
+                    total_sessions = counts['sessions']
+                    
+                    absent_days = total_working_days - full_days - half_days
+                    effective_present_days = full_days + (half_days * 0.5)
+                    percentage = (effective_present_days / total_working_days * 100) if total_working_days > 0 else 0
+                    
+                    yield [
+                        name, student_id_str, email,
+                        full_days, half_days, absent_days, total_sessions,
+                        f"{percentage:.1f}%"
+                    ]
+                    
+            else:  # 'session_detailed' format
+                yield ['Slot-Based Attendance Summary Report']
+                yield ['Date Range', f"{start_date} to {end_date}"]
+                yield ['Total Students', len(students)]
+                yield []
+                yield ['Date', 'Day', 'Full Day', 'Half Day', 'Absent', 'Morning', 'Afternoon', 'Attendance %']
                 
-                current_date += timedelta(days=1)
+                for current_date in working_days:
+                    date_str = current_date.isoformat()
+                    day_name = current_date.strftime('%A')
+                    counts = by_date[date_str]
+                    
+                    full_day_count = counts['full']
+                    half_day_count = counts['present'] - full_day_count
+                    absent_count = len(students) - counts['present']
+                    effective_present = full_day_count + (half_day_count * 0.5)
+                    percentage = (effective_present / len(students) * 100) if len(students) > 0 else 0
+                    
+                    yield [
+                        date_str, day_name, full_day_count, half_day_count, absent_count,
+                        counts['morning'], counts['afternoon'], f"{percentage:.1f}%"
+                    ]
         
-        output.seek(0)
         filename = f"slot_attendance_bulk_{format}_{start_date}_{end_date}.csv"
         
         return StreamingResponse(
-            io.BytesIO(output.getvalue().encode()),
+            csv_stream(export_rows()),
             media_type="text/csv",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -2413,7 +2573,7 @@ async def get_student_details(student_id: int):
         
         student = cursor.fetchone()
         if not student:
-            raise HTTPException(status_code=404, detail="Student not found")
+            return {"success": False, "message": "Student not found"}
         
         return {
             "success": True,
@@ -2523,6 +2683,8 @@ async def export_student_attendance(student_id: int):
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
         
+    except HTTPException:
+        raise  # the 404 above, not an export failure
     except Exception as e:
         print(f"[ERROR] Export failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
@@ -2550,37 +2712,14 @@ async def get_student_session_attendance(student_id: int):
 
 
 @app.get("/api/attendance/today/slots")
-async def get_today_slot_attendance():
+def get_today_slot_attendance():
     """Get today's slot-based attendance (the working system)"""
     try:
-        today = datetime.now().date()
-        timezone = pytz.timezone('Asia/Kolkata')
-        today = datetime.now(timezone).date()
-        cursor = attendance_system.conn.cursor()
-
-
-        
-        cursor.execute('''
-            SELECT s.name, s.student_id, s.email, 
-                   sa_m1.created_at as morning_1_time,
-                   sa_m2.created_at as morning_2_time,
-                   sa_a1.created_at as afternoon_1_time,
-                   sa_a2.created_at as afternoon_2_time,
-                   s.id
-            FROM students s
-            LEFT JOIN slot_attendance sa_m1 ON s.id = sa_m1.student_id 
-                AND sa_m1.date = ? AND sa_m1.slot_id = 'morning_1'
-            LEFT JOIN slot_attendance sa_m2 ON s.id = sa_m2.student_id 
-                AND sa_m2.date = ? AND sa_m2.slot_id = 'morning_2'
-            LEFT JOIN slot_attendance sa_a1 ON s.id = sa_a1.student_id 
-                AND sa_a1.date = ? AND sa_a1.slot_id = 'afternoon_1'
-            LEFT JOIN slot_attendance sa_a2 ON s.id = sa_a2.student_id 
-                AND sa_a2.date = ? AND sa_a2.slot_id = 'afternoon_2'
-            WHERE s.status = 'active'
-            ORDER BY s.name
-        ''', (today, today, today, today))
+        today = datetime.now(IST).date()
         
-        return cursor.fetchall()
+        # Sync endpoint: runs in the threadpool on a pooled connection, off the event loop
+        with attendance_system.read_pool.connection() as conn:
+            return conn.execute(SLOT_TODAY_SQL, (today,)).fetchall()
         
     except Exception as e:
         print(f"Error loading slot attendance: {e}")
@@ -2631,7 +2770,7 @@ async def get_student_sparkline(student_id: int, days: int = 14):
 async def get_live_attendance_count():
     """Get live student count with slot information"""
     try:
-        manager = create_slot_manager_instance()
+        manager = attendance_manager
         count_data = manager.get_live_student_count()
         return count_data
     except Exception as e:
@@ -2647,6 +2786,18 @@ async def get_live_attendance_count():
             "last_updated": datetime.now().strftime('%H:%M:%S')
         }
 
+# Frames analysed at once off the event loop; ONNX Runtime and OpenCV release the GIL,
+# and each model run is already multi-threaded, so a small cap avoids oversubscription
+DETECTION_CONCURRENCY = min(4, os.cpu_count() or 1)
+_detection_slots = asyncio.Semaphore(DETECTION_CONCURRENCY)
+
+def _analyze_frame(image_data: str):
+    """Decode a frame, detect faces and liveness-check each one (runs in a worker thread)"""
+    image_array = decode_image_rgb(image_data)
+    detected_faces = asian_face_recognizer.detect_faces_optimized(image_array)
+    livenesses = [anti_spoof_checker.check(image_array, face['location']) for face in detected_faces]
+    return detected_faces, livenesses
+
 @app.post("/api/detect_attendance_slots")
 async def detect_attendance_with_slots(image_data: DetectionImage):
     """Enhanced detection with slot-based attendance marking"""
@@ -2654,22 +2805,10 @@ async def detect_attendance_with_slots(image_data: DetectionImage):
         return {"success": False, "message": "Face recognition not available"}
     
     try:
-        # Convert base64 to image (same as existing detect_attendance)
-        if image_data.image_data.startswith('data:image'):
-            image_data_clean = image_data.image_data.split(',')[1]
-        else:
-            image_data_clean = image_data.image_data
-        
-        image_bytes = base64.b64decode(image_data_clean)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        image_array = np.array(image)
-        
-        # Use existing face detection
-        detected_faces = asian_face_recognizer.detect_faces_optimized(image_array)
+        # Decode, detection and anti-spoofing are CPU-bound: run them in a worker thread
+        # so the event loop keeps serving other requests. Matching and DB writes stay here.
+        async with _detection_slots:
+            detected_faces, livenesses = await asyncio.to_thread(_analyze_frame, image_data.image_data)
         
         if len(detected_faces) == 0:
             return {
@@ -2679,17 +2818,20 @@ async def detect_attendance_with_slots(image_data: DetectionImage):
             }
         
         # Initialize slot manager
-        manager = create_slot_manager_instance()
+        manager = attendance_manager
         recognized_students = []
         unknown_faces = 0
         spoofed_faces = 0
         
-        for face_data in detected_faces:
+        # Match all detected faces against the gallery in one batch
+        matches = attendance_system.find_best_matches([face['embedding'] for face in detected_faces],
+                                                      threshold=RECOGNITION_THRESHOLD)
+        locations = face_location_dicts(detected_faces)
+        
+        for match, location, liveness in zip(matches, locations, livenesses):
             # --- ANTI-SPOOFING GATE ---
-            liveness = anti_spoof_checker.check(image_array, face_data['location'])
             if not liveness['is_real']:
                 spoofed_faces += 1
-                face_location = face_data['location']
                 recognized_students.append({
                     "student_id": None,
                     "name": "SPOOF DETECTED",
@@ -2697,96 +2839,61 @@ async def detect_attendance_with_slots(image_data: DetectionImage):
                     "status": "spoof_detected",
                     "message": f"Liveness check failed (score: {liveness['score']:.2f})",
                     "liveness_score": liveness['score'],
-                    "location": {
-                        "top": int(face_location[0]),
-                        "right": int(face_location[1]),
-                        "bottom": int(face_location[2]),
-                        "left": int(face_location[3])
-                    }
+                    "location": location
                 })
                 continue
             # --- END ANTI-SPOOFING GATE ---
 
-            face_encoding = face_data['embedding']
-            
-            # Find best match (same logic as existing)
-            if len(attendance_system.known_face_encodings) > 0:
-                similarities = []
-                for known_encoding in attendance_system.known_face_encodings:
-                    face_norm = face_encoding / np.linalg.norm(face_encoding)
-                    known_norm = known_encoding / np.linalg.norm(known_encoding)
-                    similarity = np.dot(face_norm, known_norm)
-                    similarities.append(similarity)
-                
-                best_match_index = np.argmax(similarities)
-                best_similarity = similarities[best_match_index]
-                
-                RECOGNITION_THRESHOLD = 0.60
-                
-                if best_similarity > RECOGNITION_THRESHOLD:
-                    student_id = attendance_system.known_face_ids[best_match_index]
-                    student_name = attendance_system.known_face_names[best_match_index]
-                    
-                    # Use slot manager for attendance marking
-                    attendance_result = manager.mark_attendance_with_slot(
-                        student_id=student_id,
-                        detection_confidence=best_similarity
-                    )
-                    
-                    face_location = face_data['location']
-                    
-                    if attendance_result['success']:
-                        # Successfully marked
-                        recognized_students.append({
-                            "student_id": student_id,
-                            "name": student_name,
-                            "confidence": float(best_similarity),
-                            "status": "marked",
-                            "message": attendance_result['message'],
-                            "liveness_score": liveness['score'],
-                            "slot_name": attendance_result.get('slot_name', ''),
-                            "location": {
-                                "top": int(face_location[0]),
-                                "right": int(face_location[1]),
-                                "bottom": int(face_location[2]),
-                                "left": int(face_location[3])
-                            }
-                        })
-                    elif attendance_result.get('already_marked'):
-                        # Already marked
-                        recognized_students.append({
-                            "student_id": student_id,
-                            "name": student_name,
-                            "confidence": float(best_similarity),
-                            "status": "already_marked",
-                            "message": attendance_result['message'],
-                            "liveness_score": liveness['score'],
-                            "slot_name": attendance_result.get('slot_name', ''),
-                            "location": {
-                                "top": int(face_location[0]),
-                                "right": int(face_location[1]),
-                                "bottom": int(face_location[2]),
-                                "left": int(face_location[3])
-                            }
-                        })
-                    elif attendance_result.get('outside_slot'):
-                        # Outside slot hours - return special response
-                        return {
-                            "success": False,
-                            "faces_detected": len(detected_faces),
-                            "recognized_students": [],
-                            "unknown_faces": 0,
-                            "outside_slot": True,
-                            "face_detected": True,
-                            "student_name": student_name,
-                            "confidence": float(best_similarity),
-                            "message": attendance_result['message'],
-                            "next_slot": attendance_result.get('next_slot')
-                        }
-                else:
-                    unknown_faces += 1
-            else:
+            # Faces below RECOGNITION_THRESHOLD come back from the batch match as None
+            if match is None:
                 unknown_faces += 1
+                continue
+            student_id, student_name, best_similarity = match
+            
+            # Use slot manager for attendance marking
+            attendance_result = manager.mark_attendance_with_slot(
+                student_id=student_id,
+                detection_confidence=best_similarity
+            )
+            
+            if attendance_result['success']:
+                # Successfully marked
+                recognized_students.append({
+                    "student_id": student_id,
+                    "name": student_name,
+                    "confidence": float(best_similarity),
+                    "status": "marked",
+                    "message": attendance_result['message'],
+                    "liveness_score": liveness['score'],
+                    "slot_name": attendance_result.get('slot_name', ''),
+                    "location": location
+                })
+            elif attendance_result.get('already_marked'):
+                # Already marked
+                recognized_students.append({
+                    "student_id": student_id,
+                    "name": student_name,
+                    "confidence": float(best_similarity),
+                    "status": "already_marked",
+                    "message": attendance_result['message'],
+                    "liveness_score": liveness['score'],
+                    "slot_name": attendance_result.get('slot_name', ''),
+                    "location": location
+                })
+            elif attendance_result.get('outside_slot'):
+                # Outside slot hours - return special response
+                return {
+                    "success": False,
+                    "faces_detected": len(detected_faces),
+                    "recognized_students": [],
+                    "unknown_faces": 0,
+                    "outside_slot": True,
+                    "face_detected": True,
+                    "student_name": student_name,
+                    "confidence": float(best_similarity),
+                    "message": attendance_result['message'],
+                    "next_slot": attendance_result.get('next_slot')
+                }
         
         success = len(recognized_students) > 0
         message = f"Processed {len(detected_faces)} faces, recognized {len(recognized_students)} students"
@@ -4,14 +4,100 @@
 
 import sqlite3
 import json
+import calendar
 from datetime import datetime, timedelta, date, time
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from itertools import groupby, islice
+from time import monotonic
 import logging
+import numpy as np
+
+from jit_utils import njit, NUMBA_AVAILABLE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Saturday-first calendar cells: short names in grid order, full names in date.weekday() order
+WEEK_HEADERS = ('SAT', 'SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI')
+FULL_WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# Per-day status codes in get_student_attendance_enhanced_v2's status_codes bytes
+DAY_STATUSES = ('weekend', 'holiday', 'absent', 'partial', 'present')
+WEEKEND, HOLIDAY, ABSENT, PARTIAL, PRESENT = range(5)
+
+
+def day_status_map(dates, status_codes) -> Dict[str, str]:
+    """Expand (dates, status_codes) from the student report into {date: status name}"""
+    return {day: DAY_STATUSES[code] for day, code in zip(dates, status_codes)}
+
+# Active students with today's sessions in one LEFT JOIN (probes the (student_id, date)
+# index per student); rows arrive grouped by student. One constant string, so the
+# connection's statement cache keeps it prepared between requests.
+SQL_TODAY_SESSIONS = '''
+    SELECT s.id, s.name, s.student_id, s.email,
+           sa.session_name, sa.time_marked, sa.status, sa.is_manual
+    FROM students s
+    LEFT JOIN session_attendance sa ON sa.student_id = s.id AND sa.date = ?
+    WHERE s.status = "active"
+    ORDER BY s.name, s.id, sa.time_marked
+'''
+
+JSON_STREAM_CHUNK_ITEMS = 200
+
+# The phase 1 status only changes when the working days or session windows are
+# rewritten (both clear the cache); the TTL covers edits made outside this process
+PHASE1_STATUS_CACHE_TTL = 30
+
+
+def json_array_stream(items, chunk_items: int = JSON_STREAM_CHUNK_ITEMS):
+    """Encode an iterable as one JSON array for StreamingResponse, a chunk of items at a time
+    
+    If the source fails part-way the error is logged and re-raised without closing the
+    array, so the response ends early and the client can't mistake it for a full list.
+    """
+    yield '['
+    separator = ''
+    items = iter(items)
+    try:
+        while True:
+            chunk = [json.dumps(item) for item in islice(items, chunk_items)]
+            if not chunk:
+                break
+            yield separator + ','.join(chunk)
+            separator = ','
+    except Exception as e:
+        print(f"[ERROR] JSON stream aborted: {e}")
+        raise
+    yield ']'
+
+
+class SessionBounds(NamedTuple):
+    """One session window with its times parsed and grace period applied"""
+    session: dict
+    start_time: time
+    end_time: time
+    start_with_grace: time
+    end_with_grace: time
+    window_minutes: int
+    crosses_midnight: bool
+
+
+@njit('u1[:](i8[:], i8[:], b1[:])', cache=True)
+def _day_kinds(day_numbers, holiday_numbers, working_weekdays):
+    """0=holiday, 1=non-working weekday, 2=working day, per day number (days since 1970-01-01)"""
+    kinds = np.empty(len(day_numbers), dtype=np.uint8)
+    for i in range(len(day_numbers)):
+        day = day_numbers[i]
+        j = np.searchsorted(holiday_numbers, day)
+        if j < len(holiday_numbers) and holiday_numbers[j] == day:
+            kinds[i] = 0
+        elif working_weekdays[(day + 4) % 7]:  # day 0 was a Thursday; 0=Sunday ... 6=Saturday
+            kinds[i] = 2
+        else:
+            kinds[i] = 1
+    return kinds
+
 
 def enhance_existing_attendance_system(attendance_system):
     """
@@ -45,23 +131,25 @@ def enhance_existing_attendance_system(attendance_system):
             (6, True, "Saturday")    # Saturday - Working
         ]
         
-        for day_of_week, is_working, day_name in working_days_data:
-            cursor.execute('''
-                INSERT OR REPLACE INTO working_days_config 
-                (day_of_week, is_working, day_name) 
-                VALUES (?, ?, ?)
-            ''', (day_of_week, is_working, day_name))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO working_days_config 
+            (day_of_week, is_working, day_name) 
+            VALUES (?, ?, ?)
+        ''', working_days_data)
         
         self.conn.commit()
+        self._working_days_table = True  # tables are never dropped at runtime
+        self._phase1_status_cache = None
         print("✅ Working days configuration updated: Saturday-Friday working, Sunday off")
     
-    def is_working_day_enhanced(self, check_date):
-        """Enhanced working day check using configuration"""
+    def is_working_day_enhanced(self, check_date, cursor=None):
+        """Enhanced working day check using configuration (pass cursor to reuse the caller's)"""
         if isinstance(check_date, str):
-            check_date = datetime.strptime(check_date, '%Y-%m-%d').date()
+            check_date = date.fromisoformat(check_date)
         
         # Check if it's a holiday first
-        cursor = self.conn.cursor()
+        if cursor is None:
+            cursor = self.conn.cursor()
         cursor.execute('SELECT id FROM holidays WHERE date = ?', (check_date.strftime('%Y-%m-%d'),))
         if cursor.fetchone():
             return False
@@ -80,6 +168,15 @@ def enhance_existing_attendance_system(attendance_system):
             # Fallback: Saturday (6) through Friday (5) working, Sunday (0) off
             return adjusted_day != 0
     
+    def _working_weekdays(self, cursor=None):
+        """is_working flag per weekday (0=Sunday ... 6=Saturday), one query for a whole date range"""
+        if cursor is None:
+            cursor = self.conn.cursor()
+        cursor.execute('SELECT day_of_week, is_working FROM working_days_config')
+        working_config = dict(cursor.fetchall())
+        # Same fallback as is_working_day_enhanced: Sunday off, everything else working
+        return tuple(bool(working_config.get(day, day != 0)) for day in range(7))
+    
     def update_session_windows_enhanced(self):
         """Update session windows with enhanced configuration"""
         cursor = self.conn.cursor()
@@ -94,6 +191,24 @@ def enhance_existing_attendance_system(attendance_system):
         if 'is_required' not in columns:
             cursor.execute('ALTER TABLE session_windows ADD COLUMN is_required BOOLEAN DEFAULT TRUE')
         
+        # The duplicate check, the report range and today's join all probe session_attendance by
+        # (student_id, date[, session_name]); UNIQUE also rejects a racing second mark.
+        # holidays(date) is already covered by its UNIQUE constraint. The main app's schema
+        # keys sessions by session_type (per course) and already indexes (student_id, date,
+        # session_type), so the index is only added where a session_name column exists.
+        cursor.execute("PRAGMA table_info(session_attendance)")
+        if 'session_name' in [row[1] for row in cursor.fetchall()]:
+            try:
+                try:
+                    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sa_student_date_session '
+                                   'ON session_attendance(student_id, date, session_name)')
+                except sqlite3.IntegrityError:
+                    print("[WARN] Duplicate session marks found - creating non-unique session index")
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sa_student_date_session '
+                                   'ON session_attendance(student_id, date, session_name)')
+            except sqlite3.OperationalError as e:
+                print(f"[WARN] Could not create session attendance index: {e}")
+        
         # Clear existing session windows and insert Phase 1 configuration
         cursor.execute('DELETE FROM session_windows')
         
@@ -104,72 +219,78 @@ def enhance_existing_attendance_system(attendance_system):
             ('evening', '18:00:00', '23:59:00', 15, 'Evening Lab/Project Session', 3, True, True, 360)
         ]
         
-        for session_data in enhanced_sessions:
-            cursor.execute('''
-                INSERT INTO session_windows 
-                (session_name, start_time, end_time, grace_minutes, description, 
-                 display_order, is_active, is_required, attendance_window_minutes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', session_data)
+        cursor.executemany('''
+            INSERT INTO session_windows 
+            (session_name, start_time, end_time, grace_minutes, description, 
+             display_order, is_active, is_required, attendance_window_minutes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', enhanced_sessions)
         
         self.conn.commit()
         
         # Update the instance session_windows
         self.session_windows = self.get_session_windows_enhanced()
+        self._phase1_status_cache = None
         print("✅ Session windows updated with Phase 1 configuration")
     
     def get_session_windows_enhanced(self):
         """Get enhanced session windows with all details"""
+        # Columns are aliased to the session dict keys, so each sqlite3.Row converts with dict()
+        # (row factory set on this cursor only; the shared connection keeps plain tuples)
         cursor = self.conn.cursor()
+        cursor.row_factory = sqlite3.Row
         cursor.execute('''
-            SELECT session_name, start_time, end_time, grace_minutes, 
-                   description, display_order, is_required, attendance_window_minutes
+            SELECT session_name AS name, start_time, end_time,
+                   COALESCE(NULLIF(grace_minutes, 0), 10) AS grace_minutes,
+                   description, display_order AS "order", is_required,
+                   COALESCE(NULLIF(attendance_window_minutes, 0), 45) AS window_minutes
             FROM session_windows 
             WHERE is_active = TRUE 
             ORDER BY display_order
         ''')
         
-        sessions = []
-        for row in cursor.fetchall():
-            sessions.append({
-                'name': row[0],
-                'start_time': row[1],
-                'end_time': row[2],
-                'grace_minutes': row[3] or 10,
-                'description': row[4],
-                'order': row[5],
-                'is_required': row[6],
-                'window_minutes': row[7] or 45
-            })
+        return [dict(row) for row in cursor]
+    
+    def _session_bounds(self, by_name=False):
+        """SessionBounds per window, parsed once
         
-        return sessions
+        Cached until self.session_windows is replaced, so requests only compare times.
+        With by_name=True returns the same tuples in a dict keyed by session name.
+        """
+        cache = getattr(self, '_session_bounds_cache', None)
+        if cache is None or cache[0] is not self.session_windows:
+            bounds = []
+            for session in self.session_windows:
+                start_time = time.fromisoformat(session['start_time'])
+                end_time = time.fromisoformat(session['end_time'])
+                
+                # Add grace period
+                grace_delta = timedelta(minutes=session.get('grace_minutes', 10))
+                start_with_grace = (datetime.combine(date.today(), start_time) - grace_delta).time()
+                end_with_grace = (datetime.combine(date.today(), end_time) + grace_delta).time()
+                bounds.append(SessionBounds(session, start_time, end_time, start_with_grace, end_with_grace,
+                                            session.get('window_minutes', 45), end_time < start_time))
+            bounds = tuple(bounds)
+            by_session_name = {b.session['name']: b for b in bounds}
+            cache = self._session_bounds_cache = (self.session_windows, bounds, by_session_name)
+        return cache[2] if by_name else cache[1]
     
     def get_current_session_enhanced(self, current_time=None):
         """Enhanced current session detection with grace periods"""
         if current_time is None:
             current_time = datetime.now().time()
         elif isinstance(current_time, str):
-            current_time = datetime.strptime(current_time, '%H:%M:%S').time()
+            current_time = time.fromisoformat(current_time)
         
-        for session in self.session_windows:
-            start_time = datetime.strptime(session['start_time'], '%H:%M:%S').time()
-            end_time = datetime.strptime(session['end_time'], '%H:%M:%S').time()
-            
-            # Add grace period
-            grace_minutes = session.get('grace_minutes', 10)
-            grace_delta = timedelta(minutes=grace_minutes)
-            
-            # Calculate grace periods
-            start_with_grace = (datetime.combine(date.today(), start_time) - grace_delta).time()
-            end_with_grace = (datetime.combine(date.today(), end_time) + grace_delta).time()
-            
+        # Bounds are precomputed, so this is only time comparisons per session
+        for bounds in self._session_bounds():
             # Handle overnight sessions (like evening session)
-            if end_time < start_time:  # Session crosses midnight
-                if current_time >= start_with_grace or current_time <= end_with_grace:
-                    return session
+            if bounds.crosses_midnight:
+                if current_time >= bounds.start_with_grace or current_time <= bounds.end_with_grace:
+                    return bounds.session
             else:  # Normal session within same day
-                if start_with_grace <= current_time <= end_with_grace:
-                    return session
+                if bounds.start_with_grace <= current_time <= bounds.end_with_grace:
+                    return bounds.session
         
         return None
     
@@ -178,18 +299,24 @@ def enhance_existing_attendance_system(attendance_system):
         try:
             # Determine date
             if manual_date:
-                attendance_date = datetime.strptime(manual_date, '%Y-%m-%d').date()
+                attendance_date = date.fromisoformat(manual_date)
             else:
                 attendance_date = date.today()
             
+            # One cursor for the working-day check and the insert
+            cursor = self.conn.cursor()
+            
             # Check if it's a working day
-            if not self.is_working_day_enhanced(attendance_date):
+            if not self.is_working_day_enhanced(attendance_date, cursor):
                 return {
                     'success': False,
                     'message': f'Cannot mark attendance on {attendance_date.strftime("%A")} - not a working day'
                 }
             
             current_time = datetime.now().time()
+            # Formatted once; reused by the duplicate check, the insert, the summary and the response
+            date_str = attendance_date.isoformat()
+            time_str = current_time.strftime('%H:%M:%S')
             
             # Auto-detect session if not provided
             if session_name is None and not manual:
@@ -204,84 +331,108 @@ def enhance_existing_attendance_system(attendance_system):
                 # For manual attendance, default to morning session
                 session_name = 'morning'
             
-            cursor = self.conn.cursor()
-            
-            # Check if already marked for this session today
-            cursor.execute('''
-                SELECT id FROM session_attendance 
-                WHERE student_id = ? AND date = ? AND session_name = ?
-            ''', (student_id, attendance_date.strftime('%Y-%m-%d'), session_name))
-            
-            if cursor.fetchone():
-                return {
-                    'success': False,
-                    'message': f'Attendance already marked for {session_name} session on {attendance_date.strftime("%Y-%m-%d")}'
-                }
-            
             # Determine attendance status
             status = 'present'
             if not manual:
                 # Check if late based on session end time
-                session_info = next((s for s in self.session_windows if s['name'] == session_name), None)
-                if session_info:
-                    session_end = datetime.strptime(session_info['end_time'], '%H:%M:%S').time()
-                    grace_minutes = session_info.get('grace_minutes', 10)
-                    
-                    # Calculate late threshold
-                    end_with_grace = (datetime.combine(date.today(), session_end) + 
-                                    timedelta(minutes=grace_minutes)).time()
-                    
-                    if current_time > end_with_grace:
-                        status = 'late'
-            
-            # Insert session attendance record
-            cursor.execute('''
-                INSERT INTO session_attendance 
-                (student_id, date, session_name, time_marked, is_manual, manual_reason, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                student_id,
-                attendance_date.strftime('%Y-%m-%d'),
-                session_name,
-                current_time.strftime('%H:%M:%S'),
-                manual,
-                reason,
-                status
-            ))
-            
-            # Update daily attendance summary
-            self._update_daily_attendance_summary(student_id, attendance_date)
-            
-            self.conn.commit()
+                session_info = self._session_bounds(by_name=True).get(session_name)
+                if session_info and current_time > session_info.end_with_grace:  # late threshold, precomputed
+                    status = 'late'
+            
+            # Session row + daily summary in one transaction: one commit, rolled back together on error
+            with self.conn:
+                # Insert session attendance record unless this session is already marked today;
+                # check and insert are one statement, so two concurrent marks can't both land
+                cursor.execute('''
+                    INSERT INTO session_attendance 
+                    (student_id, date, session_name, time_marked, is_manual, manual_reason, status)
+                    SELECT ?, ?, ?, ?, ?, ?, ?
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM session_attendance
+                        WHERE student_id = ? AND date = ? AND session_name = ?
+                    )
+                ''', (
+                    student_id,
+                    date_str,
+                    session_name,
+                    time_str,
+                    manual,
+                    reason,
+                    status,
+                    student_id,
+                    date_str,
+                    session_name
+                ))
+                if cursor.rowcount == 0:
+                    return {
+                        'success': False,
+                        'message': f'Attendance already marked for {session_name} session on {date_str}'
+                    }
+                
+                # Update daily attendance summary
+                self._update_daily_attendance_summary(
+                    student_id, attendance_date,
+                    new_session=(session_name, time_str, status, manual))
             
             return {
                 'success': True,
                 'message': f'Attendance marked for {session_name} session',
                 'session': session_name,
                 'status': status,
-                'time': current_time.strftime('%H:%M:%S'),
-                'date': attendance_date.strftime('%Y-%m-%d')
+                'time': time_str,
+                'date': date_str
             }
             
+        except sqlite3.IntegrityError:
+            # Lost a race with a concurrent mark for the same session (unique index)
+            return {
+                'success': False,
+                'message': f'Attendance already marked for {session_name} session on {date_str}'
+            }
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Error marking attendance: {str(e)}'
             }
     
-    def _update_daily_attendance_summary(self, student_id, attendance_date):
-        """Update daily attendance summary in main attendance table"""
+    def _update_daily_attendance_summary(self, student_id, attendance_date, new_session=None):
+        """Update daily attendance summary in main attendance table
+        
+        new_session=(name, time, status, is_manual) appends just that session to the existing
+        summary with one JSON1 UPDATE; the full recompute below only runs for the day's
+        first session (or a row without session_data).
+        """
         cursor = self.conn.cursor()
+        total_sessions = len(self.session_windows)
+        day = attendance_date.isoformat()
+        
+        if new_session is not None:
+            session_name, time_marked, status, is_manual = new_session
+            cursor.execute('''
+                UPDATE attendance 
+                SET session_data = json_set(
+                        json_insert(session_data, '$.sessions[#]',
+                                    json_object('name', ?, 'time', ?, 'status', ?)),
+                        '$.attended', attended_sessions + 1,
+                        '$.total_possible', ?),
+                    time_in = COALESCE(time_in, ?),
+                    total_sessions_today = ?,
+                    attended_sessions = attended_sessions + 1,
+                    is_manual = is_manual OR ?
+                WHERE student_id = ? AND date = ? AND session_data IS NOT NULL
+            ''', (session_name, time_marked, status, total_sessions, time_marked, total_sessions,
+                  bool(is_manual), student_id, day))
+            if cursor.rowcount > 0:
+                return
         
         # Get all sessions for this student on this date
         cursor.execute('''
-            SELECT session_name, time_marked, status FROM session_attendance
+            SELECT session_name, time_marked, status, is_manual FROM session_attendance
             WHERE student_id = ? AND date = ?
             ORDER BY time_marked
-        ''', (student_id, attendance_date.strftime('%Y-%m-%d')))
+        ''', (student_id, day))
         
         session_records = cursor.fetchall()
-        total_sessions = len(self.session_windows)
         attended_sessions = len(session_records)
         
         # Create session summary
@@ -309,72 +460,75 @@ def enhance_existing_attendance_system(attendance_system):
         else:
             daily_status = 'absent'
         
-        # Update or insert daily attendance record
-        cursor.execute('''
-            INSERT OR REPLACE INTO attendance 
-            (student_id, date, time_in, session_data, total_sessions_today, 
-             attended_sessions, is_manual, manual_reason)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            student_id,
-            attendance_date.strftime('%Y-%m-%d'),
+        # Update the day's row in place (stable rowid, no delete + reinsert); insert only
+        # on the first session of the day
+        summary = (
             primary_time,
             json.dumps(session_data),
             total_sessions,
             attended_sessions,
-            any(r[2] == 'manual' for r in session_records),
+            any(r[3] for r in session_records),
             'Multi-session attendance summary'
-        ))
+        )
+        cursor.execute('''
+            UPDATE attendance 
+            SET time_in = ?, session_data = ?, total_sessions_today = ?, 
+                attended_sessions = ?, is_manual = ?, manual_reason = ?
+            WHERE student_id = ? AND date = ?
+        ''', summary + (student_id, day))
+        if cursor.rowcount == 0:
+            cursor.execute('''
+                INSERT INTO attendance 
+                (time_in, session_data, total_sessions_today, 
+                 attended_sessions, is_manual, manual_reason, student_id, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', summary + (student_id, day))
     
-    def generate_saturday_first_calendar(self, year, month):
-        """Generate calendar with Saturday-first week layout"""
+    def generate_saturday_first_calendar(self, year, month, conn=None):
+        """Generate calendar with Saturday-first week layout (conn: e.g. a pooled read connection)"""
         try:
-            from calendar import monthrange
-            import calendar
-            
-            # Get month information
-            first_weekday, num_days = monthrange(year, month)
             month_name = calendar.month_name[month]
             
-            # Adjust first day for Saturday-first week
-            # Python's weekday: Monday=0, Sunday=6
-            # Our layout: Saturday=0, Sunday=1, Monday=2, ..., Friday=6
-            saturday_first_adjustment = (first_weekday + 2) % 7
+            # Saturday-first grid straight from the stdlib, padded to 6 full weeks
+            cells = list(calendar.Calendar(firstweekday=calendar.SATURDAY).itermonthdates(year, month))
+            while len(cells) < 42:
+                cells.append(cells[-1] + timedelta(days=1))
             
-            # Calculate starting date for calendar grid
-            first_date = datetime(year, month, 1)
-            start_date = first_date - timedelta(days=saturday_first_adjustment)
+            # Holidays and the weekly working-day pattern for the whole 6-week grid, fetched
+            # once instead of three queries per cell
+            cursor = (conn or self.conn).cursor()
+            cursor.execute('SELECT date, name FROM holidays WHERE date BETWEEN ? AND ?',
+                          (cells[0].isoformat(), cells[-1].isoformat()))
+            holiday_names = dict(cursor.fetchall())
+            working_weekdays = self._working_weekdays(cursor)
+            today = datetime.now().date()
             
             # Generate 6 weeks of calendar data
             calendar_weeks = []
-            current_date = start_date
-            
             for week in range(6):
                 week_days = []
-                for day_index in range(7):  # Saturday to Friday
+                for day_index, current_date in enumerate(cells[week * 7:week * 7 + 7]):  # Saturday to Friday
+                    date_str = current_date.isoformat()
+                    weekday = current_date.weekday()
+                    is_holiday = date_str in holiday_names
+                    # Same rule as is_working_day_enhanced (0=Sunday ... 6=Saturday)
+                    is_working_day = not is_holiday and working_weekdays[(weekday + 1) % 7]
+                    
                     day_info = {
-                        'date': current_date.strftime('%Y-%m-%d'),
+                        'date': date_str,
                         'day': current_date.day,
                         'is_current_month': current_date.month == month,
-                        'is_today': current_date.date() == datetime.now().date(),
-                        'is_working_day': self.is_working_day_enhanced(current_date),
-                        'weekday_name': ['SAT', 'SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI'][day_index],
-                        'weekday_full': current_date.strftime('%A')
+                        'is_today': current_date == today,
+                        'is_working_day': is_working_day,
+                        'weekday_name': WEEK_HEADERS[day_index],
+                        'weekday_full': FULL_WEEKDAYS[weekday],
+                        'is_holiday': is_holiday
                     }
                     
-                    # Check for holidays
-                    cursor = self.conn.cursor()
-                    cursor.execute('SELECT name FROM holidays WHERE date = ?', 
-                                 (current_date.strftime('%Y-%m-%d'),))
-                    holiday = cursor.fetchone()
-                    if holiday:
-                        day_info['is_holiday'] = True
-                        day_info['holiday_name'] = holiday[0]
-                    else:
-                        day_info['is_holiday'] = False
+                    if is_holiday:
+                        day_info['holiday_name'] = holiday_names[date_str]
                     
                     week_days.append(day_info)
-                    current_date += timedelta(days=1)
                 
                 calendar_weeks.append(week_days)
             
@@ -394,127 +548,89 @@ def enhance_existing_attendance_system(attendance_system):
                 'message': f'Calendar generation failed: {str(e)}'
             }
     
-    def get_student_attendance_enhanced_v2(self, student_id, start_date=None, end_date=None):
+    def get_student_attendance_enhanced_v2(self, student_id, start_date=None, end_date=None, conn=None):
         """Enhanced student attendance with session details and Saturday-first calendar"""
+        result = self.get_students_attendance_enhanced_v2([student_id], start_date, end_date, conn)
+        if not result['success']:
+            return result
+        return result['students'][int(student_id)]
+    
+    def get_students_attendance_enhanced_v2(self, student_ids, start_date=None, end_date=None, conn=None):
+        """get_student_attendance_enhanced_v2 for several students at once
+        
+        Students, their session rows and the holidays come from one query each for the
+        whole batch (ids passed as a single JSON array parameter, so there is no bound
+        parameter limit). Returns {'success': True, 'students': {id: report}}.
+        """
         try:
-            cursor = self.conn.cursor()
+            cursor = (conn or self.conn).cursor()
+            student_ids = list(dict.fromkeys(int(i) for i in student_ids))
+            ids_json = json.dumps(student_ids)
             
             # Get student info
-            cursor.execute('SELECT name, student_id, email, joining_date FROM students WHERE id = ?', (student_id,))
-            student_info = cursor.fetchone()
-            if not student_info:
-                return {'success': False, 'message': 'Student not found'}
+            cursor.execute('''
+                SELECT id, name, student_id, email, joining_date FROM students
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (ids_json,))
+            student_infos = {row[0]: row[1:] for row in cursor.fetchall()}
             
             # Determine date range
             if not end_date:
                 end_date = date.today()
             else:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-            
-            if not start_date:
-                if student_info[3]:  # joining_date
-                    try:
-                        start_date = datetime.strptime(student_info[3], '%Y-%m-%d').date()
-                    except:
-                        start_date = date.today().replace(month=1, day=1)
-                else:
-                    start_date = date.today().replace(month=1, day=1)
-            else:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            
-            # Get session attendance records
-            cursor.execute('''
-                SELECT date, session_name, time_marked, status, is_manual, manual_reason
-                FROM session_attendance 
-                WHERE student_id = ? AND date BETWEEN ? AND ?
-                ORDER BY date, time_marked
-            ''', (student_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-            
-            session_records = cursor.fetchall()
+                end_date = date.fromisoformat(end_date)
+            if start_date:
+                start_date = date.fromisoformat(start_date)
+            
+            ranges = {}
+            for sid, student_info in student_infos.items():
+                student_start = start_date
+                if not student_start:
+                    if student_info[3]:  # joining_date
+                        try:
+                            student_start = date.fromisoformat(student_info[3])
+                        except:
+                            student_start = date.today().replace(month=1, day=1)
+                    else:
+                        student_start = date.today().replace(month=1, day=1)
+                ranges[sid] = (student_start.isoformat(), end_date.isoformat())
             
-            # Get holidays
-            cursor.execute('SELECT date, name FROM holidays WHERE date BETWEEN ? AND ?',
-                          (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-            holidays = cursor.fetchall()
-            holiday_dict = {h[0]: h[1] for h in holidays}
-            
-            # Organize session data
-            session_by_date = {}
-            for record in session_records:
-                date_str = record[0]
-                if date_str not in session_by_date:
-                    session_by_date[date_str] = []
-                session_by_date[date_str].append({
-                    'session': record[1],
-                    'time': record[2],
-                    'status': record[3],
-                    'manual': record[4],
-                    'reason': record[5]
-                })
-            
-            # Create attendance calendar data
-            attendance_data = {}
-            working_days = []
-            present_days = 0
-            partial_days = 0
-            total_sessions_attended = 0
-            
-            current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime('%Y-%m-%d')
+            records_by_student = {}
+            holidays = []
+            if ranges:
+                first_day = min(r[0] for r in ranges.values())
                 
-                if date_str in holiday_dict:
-                    attendance_data[date_str] = 'holiday'
-                elif self.is_working_day_enhanced(current_date):
-                    working_days.append(current_date)
-                    day_sessions = session_by_date.get(date_str, [])
-                    sessions_count = len(day_sessions)
-                    total_sessions_attended += sessions_count
-                    
-                    if sessions_count == len(self.session_windows):
-                        attendance_data[date_str] = 'present'
-                        present_days += 1
-                    elif sessions_count > 0:
-                        attendance_data[date_str] = 'partial'
-                        partial_days += 1
-                    else:
-                        attendance_data[date_str] = 'absent'
-                else:
-                    attendance_data[date_str] = 'weekend'
+                # Session attendance records for the batch, each carrying its day's session count
+                cursor.execute('''
+                    SELECT student_id, date, session_name, time_marked, status, is_manual, manual_reason,
+                           COUNT(*) OVER (PARTITION BY student_id, date) AS attended
+                    FROM session_attendance 
+                    WHERE student_id IN (SELECT value FROM json_each(?)) AND date BETWEEN ? AND ?
+                    ORDER BY student_id, date, time_marked
+                ''', (ids_json, first_day, end_date.isoformat()))
+                for sid, rows in groupby(cursor, key=lambda r: r[0]):
+                    records_by_student[sid] = [r[1:] for r in rows]
                 
-                current_date += timedelta(days=1)
-            
-            # Calculate statistics
-            total_working_days = len(working_days)
-            absent_days = total_working_days - present_days - partial_days
-            total_possible_sessions = total_working_days * len(self.session_windows)
-            
-            daily_percentage = (present_days / total_working_days * 100) if total_working_days > 0 else 0
-            session_percentage = (total_sessions_attended / total_possible_sessions * 100) if total_possible_sessions > 0 else 0
-            
-            return {
-                'success': True,
-                'attendance': attendance_data,
-                'session_details': session_by_date,
-                'session_windows': self.session_windows,
-                'stats': {
-                    'present_days': present_days,
-                    'partial_days': partial_days,
-                    'absent_days': absent_days,
-                    'total_working_days': total_working_days,
-                    'total_sessions_attended': total_sessions_attended,
-                    'total_possible_sessions': total_possible_sessions,
-                    'daily_percentage': round(daily_percentage, 1),
-                    'session_percentage': round(session_percentage, 1),
-                    'holidays': len(holiday_dict)
-                },
-                'student_info': {
-                    'name': student_info[0],
-                    'student_id': student_info[1],
-                    'email': student_info[2],
-                    'joining_date': student_info[3]
-                }
-            }
+                # Get holidays
+                cursor.execute('SELECT date, name FROM holidays WHERE date BETWEEN ? AND ?',
+                              (first_day, end_date.isoformat()))
+                holidays = cursor.fetchall()
+            working_weekdays = self._working_weekdays(cursor)  # replaces two queries per day in the loop
+            
+            reports = {}
+            for sid in student_ids:
+                if sid not in student_infos:
+                    reports[sid] = {'success': False, 'message': 'Student not found'}
+                    continue
+                first, last = ranges[sid]
+                # ISO date strings order like dates, so each student's range is a string test
+                session_records = [r for r in records_by_student.get(sid, ()) if first <= r[0] <= last]
+                holiday_dict = {d: name for d, name in holidays if first <= d <= last}
+                reports[sid] = self._student_attendance_report(
+                    student_infos[sid], session_records, date.fromisoformat(first), end_date,
+                    holiday_dict, working_weekdays)
+            
+            return {'success': True, 'students': reports}
             
         except Exception as e:
             return {
@@ -522,83 +638,154 @@ def enhance_existing_attendance_system(attendance_system):
                 'message': f'Error retrieving attendance: {str(e)}'
             }
     
-    def get_today_attendance_enhanced_v2(self):
+    def _student_attendance_report(self, student_info, session_records, start_date, end_date,
+                                   holiday_dict, working_weekdays):
+        """One student's report from their session rows (date, session, time, status, manual, reason, attended)"""
+        # Organize session data
+        session_by_date = {}
+        attended_by_date = {}
+        for record in session_records:
+            date_str = record[0]
+            if date_str not in session_by_date:
+                session_by_date[date_str] = []
+                attended_by_date[date_str] = record[6]
+            session_by_date[date_str].append({
+                'session': record[1],
+                'time': record[2],
+                'status': record[3],
+                'manual': record[4],
+                'reason': record[5]
+            })
+        
+        # Classify every day of the range in one pass over a datetime64 array
+        day_numbers = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+        date_strs = day_numbers.astype(str)
+        ordinals = day_numbers.astype(np.int64)
+        holiday_ordinals = np.sort(np.array(list(holiday_dict), dtype='datetime64[D]').astype(np.int64))
+        working_mask = np.array(working_weekdays, dtype=bool)
+        if NUMBA_AVAILABLE:
+            kinds = _day_kinds(ordinals, holiday_ordinals, working_mask)
+            is_holiday, is_working = kinds == 0, kinds == 2
+        else:
+            is_holiday = np.isin(ordinals, holiday_ordinals)
+            # Day 0 (1970-01-01) was a Thursday; weekday 0=Sunday ... 6=Saturday as in working_days_config
+            is_working = ~is_holiday & working_mask[(ordinals + 4) % 7]
+        
+        sessions_per_day = np.zeros(len(day_numbers), dtype=np.int64)
+        if attended_by_date:
+            session_days = np.array(list(attended_by_date), dtype='datetime64[D]') - day_numbers[0]
+            sessions_per_day[session_days.astype(np.int64)] = list(attended_by_date.values())
+        
+        total_sessions = len(self.session_windows)
+        is_present = is_working & (sessions_per_day == total_sessions)
+        is_partial = is_working & ~is_present & (sessions_per_day > 0)
+        # One byte per day instead of a dict of status strings; day_status_map() expands it
+        status_codes = np.select([is_holiday, ~is_working, is_present, is_partial],
+                                 [HOLIDAY, WEEKEND, PRESENT, PARTIAL], default=ABSENT).astype(np.uint8)
+        
+        # Calculate statistics
+        present_days = int(np.count_nonzero(is_present))
+        partial_days = int(np.count_nonzero(is_partial))
+        total_sessions_attended = int(sessions_per_day[is_working].sum())
+        total_working_days = int(np.count_nonzero(is_working))
+        absent_days = total_working_days - present_days - partial_days
+        total_possible_sessions = total_working_days * total_sessions
+        
+        daily_percentage = (present_days / total_working_days * 100) if total_working_days > 0 else 0
+        session_percentage = (total_sessions_attended / total_possible_sessions * 100) if total_possible_sessions > 0 else 0
+        
+        return {
+            'success': True,
+            'dates': date_strs.tolist(),
+            'status_codes': status_codes.tobytes(),
+            'session_details': session_by_date,
+            'session_windows': self.session_windows,
+            'stats': {
+                'present_days': present_days,
+                'partial_days': partial_days,
+                'absent_days': absent_days,
+                'total_working_days': total_working_days,
+                'total_sessions_attended': total_sessions_attended,
+                'total_possible_sessions': total_possible_sessions,
+                'daily_percentage': round(daily_percentage, 1),
+                'session_percentage': round(session_percentage, 1),
+                'holidays': len(holiday_dict)
+            },
+            'student_info': {
+                'name': student_info[0],
+                'student_id': student_info[1],
+                'email': student_info[2],
+                'joining_date': student_info[3]
+            }
+        }
+    
+    def get_today_attendance_enhanced_v2(self, conn=None):
         """Enhanced today's attendance with detailed session breakdown"""
         try:
-            today = date.today().strftime('%Y-%m-%d')
-            cursor = self.conn.cursor()
-            
-            # Get all active students
-            cursor.execute('SELECT id, name, student_id, email FROM students WHERE status = "active" ORDER BY name')
-            students = cursor.fetchall()
-            
-            # Get today's session attendance
-            cursor.execute('''
-                SELECT student_id, session_name, time_marked, status, is_manual
-                FROM session_attendance 
-                WHERE date = ?
-                ORDER BY student_id, time_marked
-            ''', (today,))
-            
-            session_records = cursor.fetchall()
-            
-            # Organize by student
-            result = []
-            for student in students:
-                student_id, name, student_id_str, email = student
-                
-                # Get this student's sessions today
-                student_sessions = [r for r in session_records if r[0] == student_id]
-                
-                # Organize sessions
-                sessions_dict = {}
-                for session_record in student_sessions:
-                    session_name = session_record[1]
-                    sessions_dict[session_name] = {
-                        'time': session_record[2],
-                        'status': session_record[3],
-                        'manual': session_record[4]
-                    }
-                
-                # Calculate overall status
-                total_sessions = len(self.session_windows)
-                attended_sessions = len(sessions_dict)
-                
-                if attended_sessions == total_sessions:
-                    overall_status = 'present'
-                elif attended_sessions > 0:
-                    overall_status = 'partial'
-                else:
-                    overall_status = 'absent'
-                
-                result.append({
-                    'student_id': student_id,
-                    'name': name,
-                    'student_id_str': student_id_str,
-                    'email': email,
-                    'sessions': sessions_dict,
-                    'overall_status': overall_status,
-                    'sessions_attended': attended_sessions,
-                    'total_sessions': total_sessions
-                })
-            
-            return result
-            
+            return list(self.iter_today_attendance_enhanced_v2(conn))
         except Exception as e:
             print(f"Error in get_today_attendance_enhanced_v2: {e}")
             return []
     
+    def iter_today_attendance_enhanced_v2(self, conn=None):
+        """Yield today's per-student entries as the rows come off the cursor (for streaming)"""
+        today = date.today().isoformat()
+        cursor = (conn or self.conn).cursor()
+        
+        cursor.execute(SQL_TODAY_SESSIONS, (today,))
+        
+        total_sessions = len(self.session_windows)
+        
+        # Organize by student
+        for (student_id, name, student_id_str, email), rows in groupby(cursor, key=lambda r: r[:4]):
+            # Organize sessions (a student with no sessions today has one all-NULL row)
+            sessions_dict = {}
+            for session_record in rows:
+                if session_record[4] is None:
+                    continue
+                sessions_dict[session_record[4]] = {
+                    'time': session_record[5],
+                    'status': session_record[6],
+                    'manual': session_record[7]
+                }
+            
+            # Calculate overall status
+            attended_sessions = len(sessions_dict)
+            
+            if attended_sessions == total_sessions:
+                overall_status = 'present'
+            elif attended_sessions > 0:
+                overall_status = 'partial'
+            else:
+                overall_status = 'absent'
+            
+            yield {
+                'student_id': student_id,
+                'name': name,
+                'student_id_str': student_id_str,
+                'email': email,
+                'sessions': sessions_dict,
+                'overall_status': overall_status,
+                'sessions_attended': attended_sessions,
+                'total_sessions': total_sessions
+            }
+    
     # Bind methods to the attendance_system instance
     attendance_system.update_working_days_config = update_working_days_config.__get__(attendance_system)
     attendance_system.is_working_day_enhanced = is_working_day_enhanced.__get__(attendance_system)
+    attendance_system._working_weekdays = _working_weekdays.__get__(attendance_system)
     attendance_system.update_session_windows_enhanced = update_session_windows_enhanced.__get__(attendance_system)
     attendance_system.get_session_windows_enhanced = get_session_windows_enhanced.__get__(attendance_system)
+    attendance_system._session_bounds = _session_bounds.__get__(attendance_system)
     attendance_system.get_current_session_enhanced = get_current_session_enhanced.__get__(attendance_system)
     attendance_system.mark_attendance_enhanced = mark_attendance_enhanced.__get__(attendance_system)
     attendance_system._update_daily_attendance_summary = _update_daily_attendance_summary.__get__(attendance_system)
     attendance_system.generate_saturday_first_calendar = generate_saturday_first_calendar.__get__(attendance_system)
     attendance_system.get_student_attendance_enhanced_v2 = get_student_attendance_enhanced_v2.__get__(attendance_system)
+    attendance_system.get_students_attendance_enhanced_v2 = get_students_attendance_enhanced_v2.__get__(attendance_system)
+    attendance_system._student_attendance_report = _student_attendance_report.__get__(attendance_system)
     attendance_system.get_today_attendance_enhanced_v2 = get_today_attendance_enhanced_v2.__get__(attendance_system)
+    attendance_system.iter_today_attendance_enhanced_v2 = iter_today_attendance_enhanced_v2.__get__(attendance_system)
 
 
 def add_phase1_api_endpoints(app, attendance_system):
@@ -606,24 +793,28 @@ def add_phase1_api_endpoints(app, attendance_system):
     Add these new API endpoints to your FastAPI app
     Call this after creating your app and attendance_system
     """
+    from fastapi.responses import Response, StreamingResponse
     
     @app.get("/api/working-days/config")
-    async def get_working_days_config():
+    def get_working_days_config():
         """Get working days configuration"""
         try:
-            cursor = attendance_system.conn.cursor()
-            cursor.execute('''
-                SELECT day_of_week, is_working, day_name 
-                FROM working_days_config 
-                ORDER BY day_of_week
-            ''')
-            
-            config = {}
-            for row in cursor.fetchall():
-                config[row[0]] = {
-                    'is_working': bool(row[1]),
-                    'day_name': row[2]
-                }
+            # Sync endpoint: runs in the threadpool on a pooled connection, off the event loop
+            with attendance_system.read_pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                cursor.execute('''
+                    SELECT day_of_week, is_working, day_name 
+                    FROM working_days_config 
+                    ORDER BY day_of_week
+                ''')
+                
+                config = {}
+                for row in cursor:
+                    config[row['day_of_week']] = {
+                        'is_working': bool(row['is_working']),
+                        'day_name': row['day_name']
+                    }
             
             return {
                 'success': True,
@@ -695,31 +886,57 @@ def add_phase1_api_endpoints(app, attendance_system):
             return {'success': False, 'message': str(e)}
     
     @app.get("/api/calendar/enhanced/{year}/{month}")
-    async def get_enhanced_calendar(year: int, month: int):
+    def get_enhanced_calendar(year: int, month: int):
         """Get Saturday-first calendar layout"""
         try:
-            result = attendance_system.generate_saturday_first_calendar(year, month)
+            with attendance_system.read_pool.connection() as conn:
+                result = attendance_system.generate_saturday_first_calendar(year, month, conn)
             return result
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
     @app.get("/api/attendance/student/{student_id}/enhanced-v2")
-    async def get_student_attendance_enhanced_v2_api(student_id: int):
+    def get_student_attendance_enhanced_v2_api(student_id: int):
         """Get enhanced attendance data with session details"""
         try:
-            result = attendance_system.get_student_attendance_enhanced_v2(student_id)
+            # Sync endpoint: runs in the threadpool on a pooled connection, off the event loop
+            with attendance_system.read_pool.connection() as conn:
+                result = attendance_system.get_student_attendance_enhanced_v2(student_id, conn=conn)
+            if result.get('success'):
+                result['attendance'] = day_status_map(result.pop('dates'), result.pop('status_codes'))
             return result
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
-    @app.get("/api/attendance/today/enhanced-v2")
-    async def get_today_attendance_enhanced_v2_api():
-        """Get today's attendance with enhanced session details"""
+    @app.post("/api/attendance/students/enhanced-v2")
+    def get_students_attendance_enhanced_v2_api(data: dict):
+        """Enhanced attendance for a list of students in one request (student_ids, optional start_date/end_date)"""
         try:
-            result = attendance_system.get_today_attendance_enhanced_v2()
+            student_ids = data.get('student_ids') or []
+            if not isinstance(student_ids, list):
+                return {'success': False, 'message': 'student_ids must be a list'}
+            
+            with attendance_system.read_pool.connection() as conn:
+                result = attendance_system.get_students_attendance_enhanced_v2(
+                    student_ids, data.get('start_date'), data.get('end_date'), conn=conn)
+            for report in result.get('students', {}).values():
+                if report.get('success'):
+                    report['attendance'] = day_status_map(report.pop('dates'), report.pop('status_codes'))
             return result
         except Exception as e:
-            return []
+            return {'success': False, 'message': str(e)}
+    
+    @app.get("/api/attendance/today/enhanced-v2")
+    def get_today_attendance_enhanced_v2_api():
+        """Get today's attendance with enhanced session details"""
+        def today_rows():
+            # The pooled connection is held while the response streams (in the threadpool)
+            with attendance_system.read_pool.connection() as conn:
+                yield from attendance_system.iter_today_attendance_enhanced_v2(conn)
+        
+        # Same JSON array as before, but students are encoded and sent as the cursor
+        # produces them instead of building the whole list first
+        return StreamingResponse(json_array_stream(today_rows()), media_type="application/json")
     
     @app.post("/api/system/initialize-phase1")
     async def initialize_phase1():
@@ -746,23 +963,37 @@ def add_phase1_api_endpoints(app, attendance_system):
             return {'success': False, 'message': f'Initialization failed: {str(e)}'}
     
     @app.get("/api/system/phase1-status")
-    async def get_phase1_status():
+    def get_phase1_status():
         """Get Phase 1 system status"""
         try:
-            cursor = attendance_system.conn.cursor()
-            
-            # Check if enhanced tables exist
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='working_days_config'")
-            working_days_table = cursor.fetchone() is not None
-            
-            cursor.execute("SELECT COUNT(*) FROM session_windows WHERE is_active = TRUE")
-            active_sessions = cursor.fetchone()[0]
-            
-            # Check working days configuration
-            cursor.execute("SELECT COUNT(*) FROM working_days_config WHERE is_working = TRUE")
-            working_days_count = cursor.fetchone()[0] if working_days_table else 0
+            # Cached as encoded JSON, so a hit skips FastAPI's encoder as well as the queries
+            cached = getattr(attendance_system, '_phase1_status_cache', None)
+            if cached is not None and cached[0] > monotonic():
+                return Response(content=cached[1], media_type="application/json")
+            
+            # Sync endpoint: runs in the threadpool on a pooled connection, off the event loop
+            with attendance_system.read_pool.connection() as conn:
+                # Check if enhanced tables exist; once seen, the table stays, so sqlite_master
+                # is only read until then
+                working_days_table = getattr(attendance_system, '_working_days_table', False)
+                if not working_days_table:
+                    working_days_table = conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='working_days_config'"
+                    ).fetchone() is not None
+                    attendance_system._working_days_table = working_days_table
+                
+                # Both counts in one statement (working_days_config may not exist yet)
+                if working_days_table:
+                    active_sessions, working_days_count = conn.execute('''
+                        SELECT (SELECT COUNT(*) FROM session_windows WHERE is_active = TRUE),
+                               (SELECT COUNT(*) FROM working_days_config WHERE is_working = TRUE)
+                    ''').fetchone()
+                else:
+                    active_sessions = conn.execute(
+                        "SELECT COUNT(*) FROM session_windows WHERE is_active = TRUE").fetchone()[0]
+                    working_days_count = 0
             
-            return {
+            status = {
                 'success': True,
                 'phase1_initialized': working_days_table and active_sessions >= 3,
                 'features': {
@@ -774,5 +1005,8 @@ def add_phase1_api_endpoints(app, attendance_system):
                 },
                 'session_windows': attendance_system.session_windows
             }
+            body = json.dumps(status).encode()
+            attendance_system._phase1_status_cache = (monotonic() + PHASE1_STATUS_CACHE_TTL, body)
+            return Response(content=body, media_type="application/json")
         except Exception as e:
             return {'success': False, 'message': str(e)}
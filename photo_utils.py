@@ -1,21 +1,42 @@
 import os
-import shutil
 import re
+import errno
+import shutil
 import json
 import sqlite3
+import threading
+from functools import lru_cache
 from datetime import datetime
 
-def create_student_photo_directory(student_id, student_name):
-    """Create a directory for student's photos"""
+# Chunk size for the userspace copy fallback in _move_photo (default is 64 KiB on Linux)
+COPY_BUF = 1 << 20
+
+# Folder-name cleanup patterns, compiled once
+_UNSAFE_CHARS_RE = re.compile(r'[^\w\s-]')
+_SEPARATORS_RE = re.compile(r'[-\s]+')
+
+# Next photo number per student directory; seeded from one directory scan, then counted
+# in memory (photos are written in the background, so a fresh scan could also miss
+# the previous upload and hand out the same number twice)
+_photo_counts = {}
+_photo_counts_lock = threading.Lock()
+
+@lru_cache(maxsize=4096)
+def _student_photo_dir(student_id, student_name):
+    """student_photos/<StudentID>_<Clean_Name> (pure, so cached per student)"""
     # Clean student name for folder name (remove special characters)
-    clean_name = re.sub(r'[^\w\s-]', '', student_name).strip()
-    clean_name = re.sub(r'[-\s]+', '_', clean_name)
+    clean_name = _UNSAFE_CHARS_RE.sub('', student_name).strip()
+    clean_name = _SEPARATORS_RE.sub('_', clean_name)
     
     # Create directory name: StudentID_StudentName
     dir_name = f"{student_id}_{clean_name}"
-    student_dir = os.path.join('student_photos', dir_name)
+    return os.path.join('student_photos', dir_name)
+
+def create_student_photo_directory(student_id, student_name):
+    """Create a directory for student's photos"""
+    student_dir = _student_photo_dir(student_id, student_name)
     
-    # Create directory if it doesn't exist
+    # Create directory if it doesn't exist (not cached, in case it was removed since)
     os.makedirs(student_dir, exist_ok=True)
     
     return student_dir
@@ -25,12 +46,52 @@ def get_student_photo_path(student_id, student_name, session_id, timestamp):
     student_dir = create_student_photo_directory(student_id, student_name)
     
     # Create filename: photo_1.jpg, photo_2.jpg, etc.
-    existing_files = [f for f in os.listdir(student_dir) if f.startswith('photo_') and f.endswith('.jpg')]
-    photo_number = len(existing_files) + 1
+    with _photo_counts_lock:
+        photo_number = _photo_counts.get(student_dir)
+        if photo_number is None:
+            photo_number = sum(1 for f in os.listdir(student_dir) if f.startswith('photo_') and f.endswith('.jpg'))
+        photo_number += 1
+        _photo_counts[student_dir] = photo_number
     
     filename = f"photo_{photo_number}_{timestamp}.jpg"
     return os.path.join(student_dir, filename)
 
+def _move_photo(src, dst):
+    """Rename src to dst; across filesystems, copy in the kernel and remove src"""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    
+    # Cross-device (e.g. a student directory on another mount): copy_file_range keeps the
+    # bytes in the kernel; shutil.copyfile already uses sendfile where that's unavailable
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        remaining = size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break  # stopped short; redone below
+                remaining -= copied
+        except (AttributeError, OSError):
+            pass
+        if remaining > 0:
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, COPY_BUF)
+            fdst.flush()
+        copied_size = os.fstat(fdst.fileno()).st_size
+    # Only drop the source once the destination provably holds every byte
+    if copied_size != size:
+        os.unlink(dst)
+        raise OSError(errno.EIO, f"Incomplete copy ({copied_size} of {size} bytes)", src)
+    shutil.copystat(src, dst)
+    os.unlink(src)
+
 def organize_existing_photos():
     """Organize existing photos into student directories"""
     if not os.path.exists('student_photos'):
@@ -48,21 +109,36 @@ def organize_existing_photos():
         print("No students found in database")
         return
     
+    # Filename match keys and target directories are built once per student, not once
+    # per student per file
+    match_keys = [(student_id, student_name, student_name.lower().replace(' ', '_'))
+                  for student_id, student_name in students]
+    student_dirs = {}
+    unknown_dir = None
+    
+    # Source and destination are both under student_photos/, so a move is normally a plain
+    # rename rather than shutil.move's stat + rename-or-copy fallback (see _move_photo).
+    # scandir reports the entry type from the directory listing, without a stat per file.
     moved_count = 0
+    unknown_count = 0
+    with os.scandir('student_photos') as entries:
+        entries = list(entries)  # snapshot: the moves below change the directory
     # Move existing photos to student directories
-    for file in os.listdir('student_photos'):
-        file_path = os.path.join('student_photos', file)
-        if file.endswith('.jpg') and os.path.isfile(file_path):
+    for entry in entries:
+        file, file_path = entry.name, entry.path
+        if file.endswith('.jpg') and entry.is_file():
             # Try to match file to student (if filename contains session info)
             moved = False
-            for student_id, student_name in students:
-                if student_id in file or student_name.lower().replace(' ', '_') in file.lower():
-                    student_dir = create_student_photo_directory(student_id, student_name)
+            lower_file = file.lower()
+            for student_id, student_name, name_key in match_keys:
+                if student_id in file or name_key in lower_file:
+                    student_dir = student_dirs.get(student_id)
+                    if student_dir is None:
+                        student_dir = student_dirs[student_id] = create_student_photo_directory(student_id, student_name)
                     new_path = os.path.join(student_dir, f"existing_{file}")
                     
                     try:
-                        shutil.move(file_path, new_path)
-                        print(f"📂 Moved {file} to {student_dir}")
+                        _move_photo(file_path, new_path)
                         moved_count += 1
                         moved = True
                         break
@@ -71,14 +147,17 @@ def organize_existing_photos():
             
             if not moved:
                 # Move to 'unknown' directory
-                unknown_dir = os.path.join('student_photos', 'unknown')
-                os.makedirs(unknown_dir, exist_ok=True)
+                if unknown_dir is None:
+                    unknown_dir = os.path.join('student_photos', 'unknown')
+                    os.makedirs(unknown_dir, exist_ok=True)
                 new_path = os.path.join(unknown_dir, file)
                 try:
-                    shutil.move(file_path, new_path)
-                    print(f"📂 Moved {file} to unknown directory")
+                    _move_photo(file_path, new_path)
                     moved_count += 1
+                    unknown_count += 1
                 except Exception as e:
                     print(f"❌ Error moving {file}: {e}")
     
+    print(f"📂 Moved {moved_count - unknown_count} photos to {len(student_dirs)} student directories, "
+          f"{unknown_count} to unknown")
     print(f"✅ Organized {moved_count} photos")
@@ -2,6 +2,7 @@
 import sqlite3
 import os
 from datetime import datetime
+from db_utils import connect as db_connect
 
 def setup_database():
     """Create attendance database with all required tables"""
@@ -12,9 +13,12 @@ def setup_database():
         os.rename('attendance.db', backup_name)
         print(f"📦 Backed up existing database to {backup_name}")
     
-    # Create new database
-    conn = sqlite3.connect('attendance.db')
+    # Create new database (same PRAGMAs as the app). sqlite3 runs DDL outside any
+    # transaction by default, so open one explicitly: the whole schema and the sample
+    # row commit together with a single sync instead of one per statement
+    conn = db_connect('attendance.db')
     cursor = conn.cursor()
+    cursor.execute('BEGIN')
     
     # Students table
     print("📋 Creating students table...")
@@ -24,7 +28,7 @@ def setup_database():
             student_id TEXT UNIQUE NOT NULL,
             name TEXT NOT NULL,
             email TEXT UNIQUE NOT NULL,
-            face_encoding BLOB,
+            face_encoding BLOB,  -- raw little-endian float32, unit-norm (face_matcher.encode_embedding)
             registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             status TEXT DEFAULT 'active',
             photo_count INTEGER DEFAULT 0,
@@ -52,7 +56,7 @@ def setup_database():
         CREATE TABLE face_encodings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             student_id INTEGER,
-            encoding_data BLOB,
+            encoding_data BLOB,  -- raw little-endian float32, one per registration photo
             photo_path TEXT,
             quality_score REAL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -60,7 +64,8 @@ def setup_database():
         )
     ''')
     
-    # Registration sessions table
+    # Registration sessions table - only ever looked up by session_id, so WITHOUT ROWID
+    # keeps the rows in the primary-key B-tree instead of a rowid table plus a key index
     print("📋 Creating registration_sessions table...")
     cursor.execute('''
         CREATE TABLE registration_sessions (
@@ -70,15 +75,19 @@ def setup_database():
             status TEXT DEFAULT 'in_progress',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             expires_at TIMESTAMP
-        )
+        ) WITHOUT ROWID
     ''')
     
     # Create indexes for better performance
     print("🔍 Creating indexes...")
-    cursor.execute('CREATE INDEX idx_student_id ON students(student_id)')
-    cursor.execute('CREATE INDEX idx_student_email ON students(email)')
+    # students.student_id / email already get indexes from their UNIQUE constraints, and
+    # (student_id, date) also serves student_id-only lookups, so no separate indexes for those.
+    # Today's count reads only attendance(date); the student list's COUNT/MAX(date) join and
+    # the per-day lookups read only (student_id, date) - both are index-only scans.
     cursor.execute('CREATE INDEX idx_attendance_date ON attendance(date)')
-    cursor.execute('CREATE INDEX idx_attendance_student ON attendance(student_id)')
+    cursor.execute('CREATE INDEX idx_attendance_student_date ON attendance(student_id, date)')
+    # Per-student deletes of the registration encodings
+    cursor.execute('CREATE INDEX idx_face_encodings_student ON face_encodings(student_id)')
     
     # Insert sample data for testing
     print("📝 Adding sample data...")